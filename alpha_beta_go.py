@@ -1,3 +1,5 @@
+import argparse
+
 from six.moves import input
 
 from dlgo import goboard_fast as goboard
@@ -24,8 +26,18 @@ def capture_diff(game_state):
     return -1 * diff
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--time-limit', type=float,
+                        help='seconds per move; deepens until then')
+    parser.add_argument('--num-workers', type=int, default=0,
+                        help='processes searching root moves in parallel')
+    args = parser.parse_args()
+
     game = goboard.GameState.new_game(BOARD_SIZE)
-    bot = minimax.AlphaBetaAgent(3, capture_diff)
+    bot = minimax.AlphaBetaAgent(args.depth, capture_diff,
+                                 time_limit=args.time_limit,
+                                 num_workers=args.num_workers)
 
     while not game.is_over():
         print_board(game.board)
@@ -37,6 +49,7 @@ def main():
             move = bot.select_move(game)
         print_move(game.next_player, move)
         game = game.apply_move(move)
+    bot.close()
 
 if __name__ == '__main__':
     main()
@@ -1,10 +1,27 @@
 import h5py
 
 from dlgo.agent import load_prediction_agent, load_policy_agent, AlphaGoMCTS
+from dlgo.goboard_fast import GameState
 from dlgo.rl import load_value_agent
+from dlgo.utils import print_board, print_move
 
-fast_policy = load_prediction_agent(h5py.File('alphago_sl_policy.h5', 'r'))
-strong_policy = load_prediction_agent(h5py.File('alphago_rl_policy.h5', 'r'))
-value = load_value_agent(h5py.File('alphago_value.h5', 'r'))
+def main():
+    fast_policy = load_prediction_agent(h5py.File('alphago_sl_policy.h5', 'r'))
+    strong_policy = load_prediction_agent(h5py.File('alphago_rl_policy.h5', 'r'))
+    value = load_value_agent(h5py.File('alphago_value.h5', 'r'))
 
-alphago = AlphaGoMCTS(strong_policy, fast_policy, value)
+    alphago = AlphaGoMCTS(strong_policy, fast_policy, value,
+                          num_simulations=400, rollout_limit=50)
+
+    game = GameState.new_game(19)
+    try:
+        while not game.is_over():
+            print_board(game.board)
+            move = alphago.select_move(game)
+            print_move(game.next_player, move)
+            game = game.apply_move(move)
+    finally:
+        alphago.close()
+
+if __name__ == '__main__':
+    main()
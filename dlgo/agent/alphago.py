@@ -1,44 +1,95 @@
+import multiprocessing
+import os
+import tempfile
+
+import h5py
 import numpy as np
 
 from dlgo.agent.base import Agent
+from dlgo.agent.predict import load_prediction_agent
+from dlgo.agent.rollout import rollout_batch
+from dlgo.agent.stats import SearchStats
 from dlgo.goboard_fast import Move
-from dlgo import kerasutil
-import operator
+
+__all__ = [
+    'AlphaGoMCTS',
+    'AlphaGoNode',
+]
 
 class AlphaGoNode:
     def __init__(self, parent=None, probability=1.0):
         self.parent = parent
         self.children = {}
         self.visit_count = 0
-        self.q_value = 0
         self.prior_value = probability
-        self.u_value = probability
+        # Value network and rollout results are tracked separately, so
+        # that rollouts can be backed up whenever they come back from
+        # the worker pool. Both are from the point of view of the player
+        # who made the move leading to this node.
+        self.value_sum = 0.0
+        self.value_count = 0
+        self.rollout_sum = 0.0
+        self.rollout_count = 0
+
+    def q_value(self, lambda_value):
+        if self.value_count == 0 and self.rollout_count == 0:
+            return 0.0
+        if self.rollout_count == 0:
+            return self.value_sum / self.value_count
+        if self.value_count == 0:
+            return self.rollout_sum / self.rollout_count
+        return (1 - lambda_value) * self.value_sum / self.value_count + \
+            lambda_value * self.rollout_sum / self.rollout_count
+
+    def select_child(self, c_u, lambda_value):
+        sqrt_visits = np.sqrt(self.visit_count)
 
-    def select_child(self):
-        return max(self.children.items(),
-            key=lambda child: child[1].q_value + child[1].u_value)
+        def score(child):
+            u_value = c_u * child.prior_value * sqrt_visits / (1 + child.visit_count)
+            return child.q_value(lambda_value) + u_value
+
+        return max(self.children.items(), key=lambda item: score(item[1]))
 
     def expand_children(self, moves, probabilities):
+        num_added = 0
         for move, prob in zip(moves, probabilities):
             if move not in self.children:
-                self.children[move] = AlphaGoNode(probability=prob)
+                self.children[move] = AlphaGoNode(parent=self, probability=prob)
+                num_added += 1
+        return num_added
 
     def update_values(self, leaf_value):
-        if self.parent is not None:
-            self.parent.update_values(leaf_value)
+        node = self
+        while node is not None:
+            node.value_sum += leaf_value
+            node.value_count += 1
+            leaf_value = -1 * leaf_value
+            node = node.parent
+
+    def update_rollouts(self, leaf_value):
+        node = self
+        while node is not None:
+            node.rollout_sum += leaf_value
+            node.rollout_count += 1
+            leaf_value = -1 * leaf_value
+            node = node.parent
+
+_worker_rollout_policy = None
 
-        self.visit_count += 1
-        self.q_value += leaf_value / self.visit_count
+def _init_rollout_worker(policy_file):
+    global _worker_rollout_policy
+    with h5py.File(policy_file, 'r') as h5file:
+        _worker_rollout_policy = load_prediction_agent(h5file)
 
-        if self.parent is not None:
-            c_u = 5
-            self.u_value = c_u * np.sqrt(self.parent.visit_count) \
-                * self.prior_value / (1 + self.visit_count)
+def _worker_rollout_batch(game_states, rollout_limit, greedy):
+    return rollout_batch(_worker_rollout_policy, game_states, rollout_limit, greedy)
 
 class AlphaGoMCTS(Agent):
     def __init__(self, policy_agent, fast_policy_agent, value_agent,
                 lambda_value=0.5, num_simulations=1000,
-                depth=50, rollout_limit=100):
+                depth=50, rollout_limit=100, c_u=5,
+                batch_size=16, num_rollout_workers=None,
+                greedy_rollouts=True):
         self.policy = policy_agent
         self.rollout_policy = fast_policy_agent
         self.value = value_agent
@@ -46,64 +97,169 @@ class AlphaGoMCTS(Agent):
         self.num_simulations = num_simulations
         self.depth = depth
         self.rollout_limit = rollout_limit
-        self.root = AlphaGoNode()
-
+        self.c_u = c_u
+        self.batch_size = batch_size
+        self.greedy_rollouts = greedy_rollouts
+        if num_rollout_workers is None:
+            num_rollout_workers = multiprocessing.cpu_count()
+        self.num_rollout_workers = num_rollout_workers
+        self._pool = None
+        self._policy_file = None
+        self._stats = None
 
     def select_move(self, game_state):
-        for simulation in range(self.num_simulations):
+        stats = self._stats = SearchStats()
+        root = AlphaGoNode()
+        stats.nodes_allocated += 1
+        self.expand([root], [game_state])
+        if not root.children:
+            stats.finish()
+            return Move.pass_turn()
+
+        pending = []
+        num_simulations = 0
+        while num_simulations < self.num_simulations:
+            batch_size = min(self.batch_size, self.num_simulations - num_simulations)
+            with stats.timer('selection'):
+                leaves, states = self.select_leaves(root, game_state, batch_size)
+            num_simulations += len(leaves)
+            stats.simulations += len(leaves)
+
+            to_expand = [(leaf, state) for leaf, state in zip(leaves, states)
+                         if not leaf.children and not state.is_over()]
+            self.expand([leaf for leaf, _ in to_expand],
+                        [state for _, state in to_expand])
+            values = self.evaluate(states)
+            with stats.timer('backup'):
+                for leaf, value in zip(leaves, values):
+                    leaf.update_values(-1 * value)
+
+            with stats.timer('rollout'):
+                pending.append(self.start_rollouts(leaves, states))
+                pending = self.collect_rollouts(pending, wait=False)
+        with stats.timer('rollout'):
+            self.collect_rollouts(pending, wait=True)
+        stats.finish()
+
+        return max(root.children, key=lambda move:
+                   root.children.get(move).visit_count)
+
+    def diagnostics(self):
+        if self._stats is None:
+            return {}
+        return self._stats.to_dict()
+
+    def select_leaves(self, root, game_state, batch_size):
+        # Selecting a leaf counts as a visit right away, which steers the
+        # other selections in the same batch away from it. Once we come
+        # back to a leaf we already have, the batch ends short: the leaf
+        # gets no visit, and as selection only depends on the tree, we
+        # would just come back to it again.
+        leaves, states = [], []
+        for _ in range(batch_size):
+            node = root
             current_state = game_state
-            node = self.root
-            for depth in range(self.depth):
-                if not node.children:
-                    if current_state.is_over():
-                        break
-                    moves, probabilities = self.policy_probabilities(current_state)
-                    nodes.expand_children(moves, probabilities)
-                move, node = current_state.apply_move(move)
-            value = self.value.predict(current_state)
-            rollout = self.policy_rollout(current_state)
-            weighted_value = (1 - self.lambda_value) * value + \
-                self.lambda_value * rollout
-            node.update_values(weighted_value)
-
-        move = max(self.root.children, key=lambda move:
-                    self.root.children.get(move).visit_count)
-
-        self.root = AlphaGoNode()
-        if move in self.root.children:
-            self.root = self.root.children[move]
-            self.root.parent = None
-
-        return move
-
-    def policy_probabilities(self, game_state):
-        encoder = self.policy._encoder
-        outputs = self.policy.predict(game_state)
-        legal_moves = game_state.legal_moves()
+            depth = 0
+            while depth < self.depth and node.children:
+                move, node = node.select_child(self.c_u, self.lambda_value)
+                current_state = current_state.apply_move(move)
+                depth += 1
+            if any(node is leaf for leaf in leaves):
+                extra = self._stats.extra
+                extra['short_batches'] = extra.get('short_batches', 0) + 1
+                break
+            self._stats.record_depth(depth)
+            visited = node
+            while visited is not None:
+                visited.visit_count += 1
+                visited = visited.parent
+            leaves.append(node)
+            states.append(current_state)
+        return leaves, states
+
+    def expand(self, nodes, game_states):
+        if not nodes:
+            return
+        stats = self._stats
+        with stats.timer('inference'):
+            outputs = self.policy.predict_batch(game_states)
+        stats.record_nn_call(len(game_states))
+        for node, game_state, output in zip(nodes, game_states, outputs):
+            moves, probabilities = self.policy_probabilities(game_state, output)
+            stats.nodes_allocated += node.expand_children(moves, probabilities)
+
+    def evaluate(self, game_states):
+        # Values are from the point of view of the player to move.
+        values = np.zeros(len(game_states))
+        open_indices = []
+        for i, game_state in enumerate(game_states):
+            if game_state.is_over():
+                values[i] = 1 if game_state.winner() == game_state.next_player else -1
+            else:
+                open_indices.append(i)
+        if open_indices:
+            with self._stats.timer('inference'):
+                values[open_indices] = self.value.predict_batch(
+                    [game_states[i] for i in open_indices])
+            self._stats.record_nn_call(len(open_indices))
+        return values
+
+    def policy_probabilities(self, game_state, outputs):
+        encoder = self.policy.encoder
+        legal_moves = [move for move in game_state.legal_moves() if move.is_play]
         if not legal_moves:
-            return [], []
-        encoded_points = [encoder.encode_point(move.point) for move in legal_moves if move.point]
+            if game_state.is_over():
+                return [], []
+            return [Move.pass_turn()], [1.0]
+        encoded_points = [encoder.encode_point(move.point) for move in legal_moves]
         legal_outputs = outputs[encoded_points]
         normalized_outputs = legal_outputs / np.sum(legal_outputs)
         return legal_moves, normalized_outputs
 
-    def policy_rollout(self, game_state):
-        for step in range(self.rollout_limit):
-            if game_state.is_over():
-                break
-            move_probabilities = self.rollout_policy.predict(game_state)
-            encoder = self.rollout_policy._encoder
-            valid_moves = [m for idx, m in enumerate(move_probabilities)
-                            if Move(encoder.decode_point_index(idx)) in game_state.legal_moves()]
-            max_index, max_value = max(enumerate(valid_moves), key=operator.itemgetter(1))
-            max_point = encoder.decode_point_index(max_index)
-            greedy_move = Move(max_point)
-            if greedy_move in game_state.legal_moves():
-                game_state = game_state.apply_move(greedy_move)
-
-        next_player = game_state.next_player
-        winner = game_state.winner()
-        if winner is not None:
-            return 1 if winner == next_player else -1
-        else:
-            return 0
+    def start_rollouts(self, leaves, game_states):
+        if self.num_rollout_workers == 0:
+            return leaves, rollout_batch(
+                self.rollout_policy, game_states,
+                self.rollout_limit, self.greedy_rollouts)
+        if self._pool is None:
+            self._start_pool()
+        result = self._pool.apply_async(
+            _worker_rollout_batch,
+            ([game_state.detached() for game_state in game_states],
+             self.rollout_limit, self.greedy_rollouts))
+        return leaves, result
+
+    def collect_rollouts(self, pending, wait):
+        still_pending = []
+        for leaves, result in pending:
+            if isinstance(result, list):
+                rollouts = result
+            elif wait or result.ready():
+                rollouts = result.get()
+            else:
+                still_pending.append((leaves, result))
+                continue
+            for leaf, rollout in zip(leaves, rollouts):
+                leaf.update_rollouts(-1 * rollout)
+        return still_pending
+
+    def _start_pool(self):
+        # Workers can't share our Keras model, so each of them loads its
+        # own copy of the fast policy from a temporary file.
+        tempfd, self._policy_file = tempfile.mkstemp(prefix='tmp-rollout-policy')
+        os.close(tempfd)
+        with h5py.File(self._policy_file, 'w') as h5file:
+            self.rollout_policy.serialize(h5file)
+        self._pool = multiprocessing.Pool(
+            processes=self.num_rollout_workers,
+            initializer=_init_rollout_worker,
+            initargs=(self._policy_file,))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        if self._policy_file is not None:
+            os.unlink(self._policy_file)
+            self._policy_file = None
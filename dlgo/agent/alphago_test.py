@@ -0,0 +1,57 @@
+import unittest
+
+import numpy as np
+
+from dlgo.agent.alphago import AlphaGoMCTS
+from dlgo.encoders.oneplane import OnePlaneEncoder
+from dlgo.goboard_fast import GameState
+
+
+class UniformPolicy:
+    def __init__(self, encoder):
+        self.encoder = encoder
+
+    def predict_batch(self, game_states):
+        num_points = self.encoder.num_points()
+        return np.ones((len(game_states), num_points)) / num_points
+
+
+class ZeroValue:
+    def predict_batch(self, game_states):
+        return np.zeros(len(game_states))
+
+
+class AlphaGoMCTSTest(unittest.TestCase):
+    def test_batch_larger_than_leaves(self):
+        # With depth 1 the leaves are the 9 moves at the root, so every
+        # batch of 16 selects some of them twice.
+        encoder = OnePlaneEncoder((3, 3))
+        policy = UniformPolicy(encoder)
+        roots = []
+
+        class RootRecordingMCTS(AlphaGoMCTS):
+            def expand(self, nodes, game_states):
+                if not roots:
+                    roots.extend(nodes)
+                AlphaGoMCTS.expand(self, nodes, game_states)
+
+        mcts = RootRecordingMCTS(
+            policy, policy, ZeroValue(), num_simulations=30, depth=1,
+            rollout_limit=5, batch_size=16, num_rollout_workers=0)
+        mcts.select_move(GameState.new_game(3))
+        root = roots[0]
+
+        self.assertEqual(9, len(root.children))
+        self.assertEqual(30, mcts.diagnostics()['simulations'])
+        self.assertEqual(30, root.visit_count)
+        self.assertEqual(30, root.value_count)
+        self.assertEqual(30, root.rollout_count)
+        for child in root.children.values():
+            self.assertEqual(child.visit_count, child.value_count)
+            self.assertEqual(child.visit_count, child.rollout_count)
+        self.assertEqual(30, sum(child.visit_count
+                                 for child in root.children.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,7 @@ from tensorflow.compat.v2.keras.optimizers import SGD
 from dlgo.agent.base import Agent
 from dlgo.agent.helpers import is_point_an_eye
 from dlgo import encoders
+from dlgo.encoders.symmetry import augment_batch
 from dlgo import goboard
 from dlgo import kerasutil
 
@@ -17,18 +18,19 @@ def prepare_experience_data(experience, board_width, board_height):
     return target_vectors
 
 class PolicyAgent(Agent):
-    def __init__(self, model, encoder):
+    def __init__(self, model, encoder, cache=None):
         self._model = model
         self._encoder = encoder
         self._collector = None
+        # an optional PositionCache, usually shared_position_cache()
+        self._cache = cache
 
     def set_collector(self, collector):
         self._collector = collector
 
     def select_move(self, game_state):
-        board_tensor = self._encoder.encode(game_state)
-        X = np.array([board_tensor])
-        move_probs = self._model.predict(X)[0]
+        board_tensor, move_probs = self._predict(game_state)
+        move_probs = move_probs[0]
         eps = 1e-5
         move_probs = np.clip(move_probs, eps, 1 - eps)
         move_probs = move_probs / np.sum(move_probs)
@@ -53,6 +55,12 @@ class PolicyAgent(Agent):
                 return goboard.Move.play(point)
         return goboard.Move.pass_turn()
 
+    def _predict(self, game_state):
+        if self._cache is not None:
+            return self._cache.predict(self._model, self._encoder, game_state)
+        X = self._encoder.encode_batch([game_state])
+        return X[0], self._model.predict(X)
+
     def serialize(self, h5file):
         h5file.create_group('encoder')
         h5file['encoder'].attrs['name'] = self._encoder.name()
@@ -61,7 +69,7 @@ class PolicyAgent(Agent):
         h5file.create_group('model')
         kerasutil.save_model_to_hdf5_group(self._model, h5file['model'])
 
-    def train(self, experience, lr, clipnorm, batch_size):
+    def train(self, experience, lr, clipnorm, batch_size, augment=False):
         self._model.compile(
             loss='categorical_crossentropy',
             optimizer=SGD(lr=lr, clipnorm=clipnorm))
@@ -73,8 +81,14 @@ class PolicyAgent(Agent):
             self._encoder.board_width,
             self._encoder.board_height)
 
+        states = experience.unpacked_states()
+        if augment:
+            states, target_vectors = augment_batch(states, target_vectors)
+
         self._model.fit(
-            experience.states, target_vectors, batch_size=batch_size, epochs=1)
+            states, target_vectors, batch_size=batch_size, epochs=1)
+        if self._cache is not None:
+            self._cache.clear_outputs()
 
 def load_policy_agent(h5file):
     model = kerasutil.load_model_from_hdf5_group(h5file['model'])
@@ -13,10 +13,13 @@ class DeepLearningAgent(Agent):
         self.encoder = encoder
 
     def predict(self, game_state):
-        encoded_state = self.encoder.encode(game_state)
-        input_tensor = np.array([encoded_state])
+        input_tensor = self.encoder.encode_batch([game_state])
         return self.model.predict(input_tensor)[0]
 
+    def predict_batch(self, game_states):
+        input_tensor = self.encoder.encode_batch(game_states)
+        return self.model.predict(input_tensor)
+
     def select_move(self, game_state):
         num_moves = self.encoder.board_width * self.encoder.board_height
         move_probs = self.predict(game_state)
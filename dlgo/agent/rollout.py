@@ -0,0 +1,139 @@
+import copy
+
+import numpy as np
+
+from dlgo.agent.helpers import is_point_an_eye
+from dlgo.goboard_fast import Move
+from dlgo.gotypes import Point
+from dlgo import scoring
+
+__all__ = [
+    'RolloutState',
+    'rollout_batch',
+    'select_masked',
+]
+
+class RolloutState:
+    # A mutable stand-in for GameState used during fast rollouts. Moves
+    # are played in place on a private copy of the board and only simple
+    # ko is tracked, so a rollout step never copies the board.
+    def __init__(self, game_state):
+        self.board = copy.deepcopy(game_state.board)
+        self.next_player = game_state.next_player
+        self.num_passes = 0
+        last_move = game_state.last_move
+        if last_move is not None and last_move.is_pass:
+            self.num_passes = 1
+        self._ko_point = game_state.ko_point()
+
+    def is_over(self):
+        return self.num_passes >= 2
+
+    def ko_point(self):
+        return self._ko_point
+
+    def does_move_violate_ko(self, player, move):
+        return player == self.next_player and move.is_play and \
+            move.point == self._ko_point
+
+    def is_valid_move(self, move):
+        if self.is_over():
+            return False
+        if not move.is_play:
+            return True
+        return self.board.get(move.point) is None and \
+            move.point != self._ko_point and \
+            not self.board.is_self_capture(self.next_player, move.point)
+
+    def legal_mask(self, encoder):
+        # Legal moves that don't fill one of our own eyes, indexed like
+        # the policy output.
+        board = self.board
+        player = self.next_player
+        mask = np.zeros(encoder.num_points(), dtype=bool)
+        for row in range(1, board.num_rows + 1):
+            for col in range(1, board.num_cols + 1):
+                point = Point(row, col)
+                if board.get(point) is not None or point == self._ko_point:
+                    continue
+                if board.is_self_capture(player, point) or \
+                        is_point_an_eye(board, point, player):
+                    continue
+                mask[encoder.encode_point(point)] = True
+        return mask
+
+    def play(self, move):
+        player = self.next_player
+        self.next_player = player.other
+        if not move.is_play:
+            self.num_passes += 1
+            self._ko_point = None
+            return
+        self.num_passes = 0
+        board = self.board
+        captured = []
+        for neighbor in board.neighbors(move.point):
+            neighbor_string = board.get_go_string(neighbor)
+            if neighbor_string is not None and neighbor_string.color != player and \
+                    neighbor_string.num_liberties == 1 and \
+                    neighbor_string not in captured:
+                captured.append(neighbor_string)
+        board.place_stone(player, move.point)
+        self._ko_point = None
+        # A single stone capturing a single stone, and left in atari
+        # itself, can be taken back immediately: that's a ko.
+        if len(captured) == 1 and len(captured[0].stones) == 1:
+            new_string = board.get_go_string(move.point)
+            if len(new_string.stones) == 1 and new_string.num_liberties == 1:
+                self._ko_point = next(iter(captured[0].stones))
+
+    def apply_move(self, move):
+        next_state = copy.copy(self)
+        next_state.board = copy.deepcopy(self.board)
+        next_state.play(move)
+        return next_state
+
+def select_masked(move_probs, legal_mask, greedy=True):
+    # Pick a move index among the legal ones in a single NumPy pass:
+    # the argmax of the masked probabilities, or for sampling the argmax
+    # of the masked log-probabilities plus Gumbel noise.
+    if not legal_mask.any():
+        return None
+    if greedy:
+        return int(np.argmax(np.where(legal_mask, move_probs, -1)))
+    with np.errstate(divide='ignore'):
+        scores = np.log(move_probs) + np.random.gumbel(size=move_probs.shape)
+    scores = np.where(legal_mask, scores, -np.inf)
+    if not np.isfinite(scores).any():
+        scores = np.where(legal_mask, np.random.random(move_probs.shape), -np.inf)
+    return int(np.argmax(scores))
+
+def rollout_batch(rollout_policy, game_states, rollout_limit, greedy=True):
+    # Play all rollouts in lockstep so each step needs a single call to
+    # the fast policy. Results are from the point of view of the player
+    # to move in each of the given positions.
+    encoder = rollout_policy.encoder
+    states = [RolloutState(game_state) for game_state in game_states]
+    active = [i for i, game_state in enumerate(game_states)
+              if not game_state.is_over()]
+    for step in range(rollout_limit):
+        active = [i for i in active if not states[i].is_over()]
+        if not active:
+            break
+        move_probs = rollout_policy.predict_batch([states[i] for i in active])
+        for i, probs in zip(active, move_probs):
+            state = states[i]
+            point_idx = select_masked(probs, state.legal_mask(encoder), greedy)
+            if point_idx is None:
+                state.play(Move.pass_turn())
+            else:
+                state.play(Move.play(encoder.decode_point_index(point_idx)))
+
+    results = []
+    for game_state, state in zip(game_states, states):
+        if game_state.is_over():
+            winner = game_state.winner()
+        else:
+            winner = scoring.compute_game_result(state).winner
+        results.append(1 if winner == game_state.next_player else -1)
+    return results
@@ -0,0 +1,115 @@
+import sys
+import time
+from contextlib import contextmanager
+
+__all__ = [
+    'PHASES',
+    'SearchStats',
+    'estimate_bytes',
+    'game_state_bytes',
+]
+
+# The phases that search agents time, named the same way across agents:
+# network calls count as inference, together with their encoding when
+# the agent can't tell the two apart, and 'search' is a whole minimax
+# search.
+PHASES = ('selection', 'encoding', 'inference', 'rollout', 'backup',
+          'pruning', 'search')
+
+def estimate_bytes(obj, shared=()):
+    # A rough memory footprint of obj: sys.getsizeof of obj and of all
+    # it holds through attributes and containers, each object once.
+    # Objects in shared, and whatever is only reachable through them,
+    # are left out; so are classes.
+    seen = {id(item) for item in shared}
+    stack = [obj]
+    num_bytes = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, type):
+            continue
+        seen.add(id(item))
+        num_bytes += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif hasattr(item, '__dict__'):
+            stack.append(vars(item))
+    return num_bytes
+
+def game_state_bytes(game_state):
+    # What a game state holds by itself: its board with the grid and
+    # arrays, and the set of earlier positions. The points and go
+    # strings on the grid and the entries of that set are mostly shared
+    # with the states before it, and the neighbor tables with every
+    # board of the same size.
+    board = game_state.board
+    shared = [game_state.previous_state, game_state.last_move]
+    shared += board._grid.keys()
+    shared += board._grid.values()
+    shared += game_state.previous_states
+    shared += [value for name, value in vars(board).items()
+               if name in ('neighbor_table', 'corner_table')]
+    return estimate_bytes(game_state, shared)
+
+class SearchStats:
+    # Per-move counters for search agents, reported through
+    # Agent.diagnostics().
+    def __init__(self):
+        self.simulations = 0
+        self.nodes_allocated = 0
+        self.nn_calls = 0
+        self.nn_positions = 0
+        self.max_nn_batch = 0
+        self.cache_hits = 0
+        self.max_depth = 0
+        self.total_depth = 0
+        self.num_depths = 0
+        self.timings = {}
+        # anything agent specific, e.g. the top candidate moves
+        self.extra = {}
+        self.total_time = 0.0
+        self._start = time.time()
+
+    def record_depth(self, depth):
+        self.max_depth = max(self.max_depth, depth)
+        self.total_depth += depth
+        self.num_depths += 1
+
+    def record_nn_call(self, batch_size):
+        self.nn_calls += 1
+        self.nn_positions += batch_size
+        self.max_nn_batch = max(self.max_nn_batch, batch_size)
+
+    @contextmanager
+    def timer(self, phase):
+        if phase not in PHASES:
+            raise ValueError('Unknown search phase %r' % (phase,))
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings[phase] = self.timings.get(phase, 0.0) + time.time() - start
+
+    def finish(self):
+        self.total_time = time.time() - self._start
+
+    def to_dict(self):
+        avg_depth = self.total_depth / self.num_depths if self.num_depths else 0.0
+        avg_batch = self.nn_positions / self.nn_calls if self.nn_calls else 0.0
+        diagnostics = dict(self.extra)
+        diagnostics.update({
+            'simulations': int(self.simulations),
+            'nodes_allocated': int(self.nodes_allocated),
+            'nn_calls': int(self.nn_calls),
+            'nn_avg_batch_size': float(avg_batch),
+            'nn_max_batch_size': int(self.max_nn_batch),
+            'cache_hits': int(self.cache_hits),
+            'max_depth': int(self.max_depth),
+            'avg_depth': float(avg_depth),
+            'total_time': float(self.total_time),
+            'timings': {phase: float(t) for phase, t in self.timings.items()},
+        })
+        return diagnostics
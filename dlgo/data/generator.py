@@ -1,10 +1,21 @@
 import glob
+import os.path
 import numpy as np
 from keras.utils import to_categorical
 
+from dlgo.encoders.symmetry import augment_batch
+
 class DataGenerator:
-    def __init__(self, data_directory, samples):
+    def __init__(self, data_directory, samples, encoder=None, augment=False,
+                 feature_directory=None):
         self.data_directory = data_directory
+        # where the feature files are, if not next to the labels
+        self.feature_directory = feature_directory or data_directory
+        # With an encoder, bit-packed feature files are unpacked batch by
+        # batch rather than all at once.
+        self.encoder = encoder
+        # Show every sample in a random one of the board's symmetries.
+        self.augment = augment
         self.samples = samples
         self.files = set(file_name for file_name, index in samples)
         self.num_samples = None
@@ -21,18 +32,26 @@ class DataGenerator:
     def _generate(self, batch_size, num_classes):
         for zip_file_name in self.files:
             file_name = zip_file_name.replace('.tar.gz', '') + 'train'
-            base = self.data_directory + '/' + file_name + '_features_*.npy'
-            for feature_file in glob.glob(base):
-                label_file = feature_file.replace('features', 'labels')
+            base = self.data_directory + '/' + file_name + '_labels_*.npy'
+            for label_file in glob.glob(base):
+                feature_file = self.feature_directory + '/' + \
+                    os.path.basename(label_file).replace('labels', 'features')
                 x = np.load(feature_file)
                 y = np.load(label_file)
-                x = x.astype('float32')
                 y = to_categorical(y.astype(int), num_classes)
                 while x.shape[0] >= batch_size:
                     x_batch, x = x[:batch_size], x[batch_size:]
                     y_batch, y = y[:batch_size], y[batch_size:]
+                    x_batch = self._unpack(x_batch)
+                    if self.augment:
+                        x_batch, y_batch = augment_batch(x_batch, y_batch)
                     yield x_batch, y_batch
 
+    def _unpack(self, x):
+        if self.encoder is None:
+            return x.astype('float32')
+        return self.encoder.unpack(x)
+
     def generate(self, batch_size=128, num_classes=19 * 19):
         while True:
             for item in self._generate(batch_size, num_classes):
@@ -16,15 +16,21 @@ from dlgo.data.index_processor import KGSIndex
 from dlgo.data.sampling import Sampler
 
 class GoDataProcessor:
-    def __init__(self, encoder='simple', data_directory='data'):
-        self.encoder = get_encoder_by_name(encoder, 19)
+    def __init__(self, encoder='simple', data_directory='data', packed=False):
+        # One encoder name, or a list of them to encode every position
+        # with each in the same pass over the games.
+        names = [encoder] if isinstance(encoder, str) else list(encoder)
+        self.encoders = {name: get_encoder_by_name(name, 19) for name in names}
+        self.encoder = self.encoders[names[0]]
         self.data_dir = data_directory
+        # Store features bit-packed along the plane axis, see
+        # Encoder.pack; they are unpacked again when loaded.
+        self.packed = packed
 
     @staticmethod
     def get_handicap(sgf):
         go_board = Board(19, 19)
         first_move_done = False
-        move = None
         game_state = GameState.new_game(19)
         if sgf.get_handicap() is not None and sgf.get_handicap() != 0:
             for setup in sgf.get_root().get_setup_stones():
@@ -32,7 +38,7 @@ class GoDataProcessor:
                     row, col = move
                     go_board.place_stone(Player.black, Point(row + 1, col + 1))
                 first_move_done = True
-                game_state = GameState(go_board, Player.white, None, move)
+                game_state = GameState(go_board, Player.white, None, None)
         return game_state, first_move_done
 
     def load_go_data(self, data_type='train', num_samples=1000):
@@ -75,9 +81,10 @@ class GoDataProcessor:
         name_list = zip_file.getnames()
         total_examples = self.num_total_examples(zip_file, game_list, name_list)
 
-        shape = self.encoder.shape()
-        feature_shape = np.insert(shape, 0, np.asarray([total_examples]))
-        features = np.zeros(feature_shape)
+        features = {
+            name: np.zeros((total_examples,) + encoder.shape(), dtype=encoder.dtype)
+            for name, encoder in self.encoders.items()
+        }
         labels = np.zeros((total_examples,))
 
         counter = 0
@@ -101,25 +108,36 @@ class GoDataProcessor:
                     else:
                         move = Move.pass_turn()
                     if first_move_done and point is not None:
-                        features[counter] = self.encoder.encode(game_state)
+                        for name, encoder in self.encoders.items():
+                            encoder.encode_batch(
+                                [game_state], out=features[name][counter:counter + 1])
                         labels[counter] = self.encoder.encode_point(point)
                         counter += 1
                     game_state = game_state.apply_move(move)
                     first_move_done = True
 
-        feature_file_base = self.data_dir + '/' + data_file_name + '_features_%d'
         label_file_base = self.data_dir + '/' + data_file_name + '_labels_%d'
+        for name in self.encoders:
+            os.makedirs(self.feature_directory(name), exist_ok=True)
 
-        chunk = 0
         chunksize = 1024
-        while features.shape[0] >= chunksize:
-            feature_file = feature_file_base % chunk
-            label_file = label_file_base % chunk
-            chunk += 1
-            current_features, features = features[:chunksize], features[chunksize:]
-            current_labels, labels = labels[:chunksize], labels[chunksize:]
-            np.save(feature_file, current_features)
-            np.save(label_file, current_labels)
+        for chunk in range(total_examples // chunksize):
+            start, stop = chunk * chunksize, (chunk + 1) * chunksize
+            for name, encoder in self.encoders.items():
+                feature_file = self.feature_directory(name) + '/' + \
+                    data_file_name + '_features_%d' % chunk
+                current_features = features[name][start:stop]
+                if self.packed:
+                    current_features = encoder.pack(current_features)
+                np.save(feature_file, current_features)
+            np.save(label_file_base % chunk, labels[start:stop])
+
+    def feature_directory(self, name):
+        # With several encoders each gets a subdirectory for its feature
+        # files, named after it; the labels are shared.
+        if len(self.encoders) == 1:
+            return self.data_dir
+        return self.data_dir + '/' + name
 
     def consolidate_games(self, data_type, samples):
         files_needed = set(file_name for file_name, index in samples)
@@ -128,25 +146,34 @@ class GoDataProcessor:
             file_name = zip_file_name.replace('.tar.gz', '') + data_type
             file_names.append(file_name)
 
-        feature_list = []
-        label_list = []
+        label_files = []
         for file_name in file_names:
             file_prefix = file_name.replace('.tar.gz', '')
-            base = self.data_dir + '/' + file_prefix + '_features_*.npy'
-            for feature_file in glob.glob(base):
-                label_file = feature_file.replace('features', 'labels')
-                x = np.load(feature_file)
-                y = np.load(label_file)
-                x = x.astype('float32')
-                y = to_categorical(y.astype(int), 19 * 19)
-                feature_list.append(x)
-                label_list.append(y)
-        features = np.concatenate(feature_list, axis=0)
-        labels = np.concatenate(label_list, axis=0)
-        np.save('{}/features_{}.npy'.format(self.data_dir, data_type), features)
+            label_files += glob.glob(self.data_dir + '/' + file_prefix + '_labels_*.npy')
+        labels = np.concatenate([
+            to_categorical(np.load(label_file).astype(int), 19 * 19)
+            for label_file in label_files
+        ], axis=0)
         np.save('{}/labels_{}.npy'.format(self.data_dir, data_type), labels)
 
-        return features, labels
+        # With several encoders, a dict of the features and labels for
+        # each encoder name, all sharing the one labels array.
+        features_and_labels = {}
+        for name, encoder in self.encoders.items():
+            feature_dir = self.feature_directory(name)
+            stored_features = np.concatenate([
+                np.load(feature_dir + '/' +
+                        os.path.basename(label_file).replace('labels', 'features'))
+                for label_file in label_files
+            ], axis=0)
+            features = encoder.unpack(stored_features)
+            if not self.packed:
+                stored_features = features
+            np.save('{}/features_{}.npy'.format(feature_dir, data_type), stored_features)
+            features_and_labels[name] = features, labels
+        if len(self.encoders) == 1:
+            return features_and_labels[name]
+        return features_and_labels
 
     def num_total_examples(self, zip_file, game_list, name_list):
         total_examples = 0
@@ -1,5 +1,7 @@
 from dlgo.encoders.alphago import *
 from dlgo.encoders.base import *
+from dlgo.encoders.cache import *
 from dlgo.encoders.oneplane import *
 from dlgo.encoders.sevenplane import *
+from dlgo.encoders.symmetry import *
 from dlgo.encoders.simple import *
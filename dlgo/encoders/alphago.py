@@ -1,10 +1,10 @@
 import numpy as np
 
 from dlgo.encoders.base import Encoder
-from dlgo.encoders.utils import is_ladder_escape, is_ladder_capture
 from dlgo.gotypes import Point, Player
 from dlgo.goboard_fast import Move
 from dlgo.agent.helpers import is_point_an_eye
+from dlgo.ladders import LadderReader
 
 FEATRE_OFFSETS = {
     'stone_color': 0,
@@ -24,88 +24,149 @@ FEATRE_OFFSETS = {
 def offset(feature):
     return FEATRE_OFFSETS[feature]
 
+# Planes that hold the outcome of playing on an empty point. They only
+# change where the strings around the point do, so they are cached and
+# updated incrementally.
+TACTICAL_PLANES = [offset('sensibleness')] + \
+    list(range(offset('liberties_after'), offset('ladder_capture')))
+
+def move_outcome(board, player, point, neighbors):
+    # The liberties and size of the string that playing on point would
+    # leave, and the number of stones it would capture, read from the
+    # strings around the point instead of playing the move. None if the
+    # point is taken or the move is suicide.
+    if board.get(point) is not None:
+        return None
+    stones = {point}
+    liberties = set()
+    captured = []
+    for neighbor in neighbors[point]:
+        string = board.get_go_string(neighbor)
+        if string is None:
+            liberties.add(neighbor)
+        elif string.color == player:
+            stones |= string.stones
+            liberties |= string.liberties
+        elif string.num_liberties == 1 and \
+                not any(string is other for other in captured):
+            captured.append(string)
+    liberties.discard(point)
+    for string in captured:
+        for stone in string.stones:
+            if any(neighbor in stones for neighbor in neighbors[stone]):
+                liberties.add(stone)
+    if not liberties:
+        return None
+    return len(liberties), sum(len(string.stones) for string in captured), len(stones)
+
 class AlphaGoEncoder(Encoder):
+    # the turns since planes look at the game history
+    position_only = False
+
     def __init__(self, board_size=(19, 19), use_player_plane=True):
         self.board_width, self.board_height = board_size
         self.use_player_plane = use_player_plane
         self.num_planes = 48 + use_player_plane
+        self._points = [Point(row=r + 1, col=c + 1)
+                        for r in range(self.board_height)
+                        for c in range(self.board_width)]
+        self._neighbors = {
+            point: [nb for nb in point.neighbors() if self._is_on_grid(nb)]
+            for point in self._points
+        }
+        # the points whose tactics depend on the string on a point: its
+        # neighbors, and for the eye check its diagonals too
+        self._region = {
+            point: [Point(point.row + dr, point.col + dc)
+                    for dr in (-1, 0, 1) for dc in (-1, 0, 1)
+                    if self._is_on_grid(Point(point.row + dr, point.col + dc))]
+            for point in self._points
+        }
+        # for each player to move, the strings of the last position
+        # encoded and the tactical planes computed for it
+        self._tactics = {}
+        self._ladders = LadderReader()
 
     def name(self):
         return 'alphago'
 
     def encode(self, game_state):
-        board_tensor = np.zeros((self.num_planes, self.board_height, self.board_width))
-        for r in range(self.board_height):
-            for c in range(self.board_width):
-                point = Point(row=r + 1, col=c + 1)
-
-                go_string = game_state.board.get_go_string(point)
-                if go_string and go_string.color == game_state.next_player:
-                    board_tensor[offset('stone_color')][r][c] = 1
-                elif go_string and go_string.color == game_state.next_player.other:
-                    board_tensor[offset('stone_color') + 1][r][c] = 1
-                else:
-                    board_tensor[offset('stone_color') + 2][r][c] = 1
-
-                board_tensor[offset('ones')] = self.ones()
-                board_tensor[offset('zeros')] = self.zeros()
-
-                if not is_point_an_eye(game_state.board, point, game_state.next_player):
-                    board_tensor[offset('sensibleness')][r][c] = 1
-
-                ages = min(game_state.board.move_ages.get(r, c), 8)
-                if ages > 0:
-                    print(ages)
-                    board_tensor[offset('turns_since') + ages][r][c] = 1
-
-                if game_state.board.get_go_string(point):
-                    liberties = min(game_state.board.get_go_string(point).num_liberties, 8)
-                    board_tensor[offset('liberties') + liberties][r][c] = 1
-
-                move = Move(point)
-                if game_state.is_valid_move(move):
-                    new_state = game_state.apply_move(move)
-                    liberties = min(new_state.board.get_go_string(point).num_liberties, 8)
-                    board_tensor[offset('liberties_after') + liberties][r][c] = 1
-
-                    adjacent_strings = [game_state.board.get_go_string(nb)
-                                        for nb in point.neighbors()]
-                    capture_count = 0
-                    for go_string in adjacent_strings:
-                        other_player = game_state.next_player.other
-                        if go_string and go_string.num_liberties == 1 and go_string.color == other_player:
-                            capture_count += len(go_string.stones)
-                    capture_count = min(capture_count, 8)
-                    board_tensor[offset('capture_size') + capture_count][r][c] = 1
-
-                if go_string and go_string.num_liberties == 1:
-                    go_string = game_state.board.get_go_string(point)
-                    if go_string:
-                        num_atari_stones = min(len(go_string.stones), 8)
-                        board_tensor[offset('self_atari_size') + num_atari_stones][r][c] = 1
-
-                if is_ladder_capture(game_state, point):
-                    board_tensor[offset('ladder_capture')][r][c] = 1
-
-                if is_ladder_escape(game_state, point):
-                    board_tensor[offset('ladder_escape')][r][c] = 1
-
-                if self.use_player_plane:
-                    if game_state.next_player == Player.black:
-                        board_tensor[offset('ones')] = self.ones()
-                    else:
-                        board_tensor[offset('zeros')] = self.zeros()
-
-        return board_tensor
-
-    def ones(self):
-        return np.ones((1, self.board_height, self.board_width))
-
-    def zeros(self):
-        return np.zeros((1, self.board_height, self.board_width))
-
-    def capture_size(self, game_state, num_planes=8):
-        pass
+        return self.encode_batch([game_state], dtype=np.float64)[0]
+
+    def encode_batch(self, game_states, out=None, dtype=None):
+        out = self.batch_buffer(game_states, out, dtype)
+        for board_tensor, game_state in zip(out, game_states):
+            board = game_state.board
+            player = game_state.next_player
+            colors = board.color_array()
+            board_tensor[offset('stone_color')] = colors == player.value
+            board_tensor[offset('stone_color') + 1] = colors == player.other.value
+            board_tensor[offset('stone_color') + 2] = colors == 0
+            board_tensor[offset('ones')] = 1
+
+            ages = board.move_ages.move_ages
+            rows, cols = np.nonzero(ages >= 0)
+            turns_since = np.minimum(ages[rows, cols], 7).astype(int)
+            board_tensor[offset('turns_since') + turns_since, rows, cols] = 1
+
+            rows, cols = np.nonzero(colors)
+            liberties = np.minimum(board.liberty_array()[rows, cols], 8)
+            board_tensor[offset('liberties') + liberties - 1, rows, cols] = 1
+
+            board_tensor[TACTICAL_PLANES] = self._tactical_planes(board, player)[TACTICAL_PLANES]
+            # The tactics don't know about ko, which depends on the game
+            # history. Only a capture can violate it.
+            captures = board_tensor[offset('capture_size') + 1:offset('self_atari_size')].any(axis=0)
+            for r, c in zip(*np.nonzero(captures)):
+                if game_state.does_move_violate_ko(player, Move.play(Point(row=r + 1, col=c + 1))):
+                    board_tensor[TACTICAL_PLANES, r, c] = 0
+
+            captures, escapes = self._ladders.read(game_state)
+            for point in captures:
+                board_tensor[offset('ladder_capture'), point.row - 1, point.col - 1] = 1
+            for point in escapes:
+                board_tensor[offset('ladder_escape'), point.row - 1, point.col - 1] = 1
+
+            if self.use_player_plane and player == Player.black:
+                board_tensor[offset('current_player_color')] = 1
+        return out
+
+    def _tactical_planes(self, board, player):
+        # Strings are immutable, so a point whose string is the same
+        # object as last time hasn't changed; only the regions around
+        # the others are recomputed.
+        strings = [board.get_go_string(point) for point in self._points]
+        if player in self._tactics:
+            old_strings, planes = self._tactics[player]
+            dirty = set()
+            for point, string, old_string in zip(self._points, strings, old_strings):
+                if string is not old_string:
+                    dirty.update(self._region[point])
+        else:
+            planes = np.zeros((self.num_planes, self.board_height, self.board_width))
+            dirty = self._points
+        for point in dirty:
+            self._update_tactics(planes, board, player, point)
+        self._tactics[player] = (strings, planes)
+        return planes
+
+    def _update_tactics(self, planes, board, player, point):
+        r, c = point.row - 1, point.col - 1
+        planes[TACTICAL_PLANES, r, c] = 0
+        outcome = move_outcome(board, player, point, self._neighbors)
+        if outcome is None:
+            return
+        liberties, num_captured, num_stones = outcome
+        if not is_point_an_eye(board, point, player):
+            planes[offset('sensibleness'), r, c] = 1
+        planes[offset('liberties_after') + min(liberties, 8) - 1, r, c] = 1
+        planes[offset('capture_size') + min(num_captured, 7), r, c] = 1
+        if liberties == 1:
+            planes[offset('self_atari_size') + min(num_stones, 8) - 1, r, c] = 1
+
+    def _is_on_grid(self, point):
+        return 1 <= point.row <= self.board_height and \
+            1 <= point.col <= self.board_width
 
     def encode_point(self, point):
         return self.board_width * (point.row - 1) + (point.col - 1)
@@ -1,17 +1,65 @@
 import importlib
 
+import numpy as np
+
 __all__ = [
     'Encoder',
     'get_encoder_by_name',
+    'pack_planes',
+    'unpack_planes',
 ]
 
+def pack_planes(tensors):
+    # Bit-packs a batch of encoded positions along the plane axis, eight
+    # 0/1 planes to a byte, for storage.
+    return np.packbits(np.asarray(tensors) != 0, axis=1)
+
+def unpack_planes(packed, num_planes, dtype=np.float32):
+    return np.unpackbits(packed, axis=1, count=num_planes).astype(dtype)
+
 class Encoder:
+    # the compact type encode_batch fills by default; the planes are 0/1
+    dtype = np.uint8
+    # whether encode() depends on nothing but the stones, the player to
+    # move and the points ko forbids, so that PositionCache can hold its
+    # output
+    position_only = True
+
     def name(self):
         raise NotImplementedError
 
     def encode(self, game_state):
         raise NotImplementedError
 
+    def encode_batch(self, game_states, out=None, dtype=None):
+        # Encodes game_states into one array of shape
+        # (len(game_states),) + shape(), written into out when the caller
+        # passes a buffer with room for them. Encoders override this to
+        # write their planes in place instead of copying encode().
+        out = self.batch_buffer(game_states, out, dtype)
+        for board_tensor, game_state in zip(out, game_states):
+            board_tensor[:] = self.encode(game_state)
+        return out
+
+    def batch_buffer(self, game_states, out, dtype):
+        if out is None:
+            if dtype is None:
+                dtype = self.dtype
+            return np.zeros((len(game_states),) + self.shape(), dtype=dtype)
+        out = out[:len(game_states)]
+        out[:] = 0
+        return out
+
+    def pack(self, tensors):
+        return pack_planes(tensors)
+
+    def unpack(self, features, dtype=np.float32):
+        # Features as the model takes them, from storage: bit-packed
+        # features are unpacked, ones kept whole are just cast.
+        if features.shape[1] == self.num_planes:
+            return features.astype(dtype)
+        return unpack_planes(features, self.num_planes, dtype)
+
     def encode_point(self, point):
         raise NotImplementedError
 
@@ -0,0 +1,162 @@
+import itertools
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+from dlgo.encoders.utils import ko_points
+
+__all__ = [
+    'PositionCache',
+    'shared_position_cache',
+]
+
+def position_key(game_state):
+    # What the encoders look at: the stones, the player to move and the
+    # points ko or superko forbids, which depend on the game history.
+    return (game_state.board.zobrist_hash(),
+            game_state.next_player,
+            tuple(ko_points(game_state)))
+
+def encoder_key(encoder):
+    return type(encoder).__name__, encoder.shape()
+
+class PositionCache:
+    # Encoded positions, and optionally the model outputs for them, kept
+    # across moves and games so that positions that come up again (self
+    # play repeats its openings all the time) are not encoded and
+    # evaluated again. Entries are evicted least recently used first once
+    # the arrays they hold take more than max_bytes. Returned arrays are
+    # read-only and shared between callers.
+    def __init__(self, max_bytes=256 * 1024 * 1024, cache_outputs=True):
+        self.max_bytes = max_bytes
+        self.cache_outputs = cache_outputs
+        self.num_bytes = 0
+        self.encode_hits = 0
+        self.encode_misses = 0
+        self.output_hits = 0
+        self.output_misses = 0
+        self.num_evictions = 0
+        self._entries = OrderedDict()
+        # a token for each live model, never reused the way id() is
+        self._model_tokens = {}
+        self._next_token = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def encode(self, encoder, game_state):
+        if not encoder.position_only:
+            raise ValueError('%s encodes more than the position and cannot be cached'
+                             % type(encoder).__name__)
+        key = ('encoding', encoder_key(encoder), position_key(game_state))
+        board_tensor = self._get(key)
+        if board_tensor is not None:
+            self.encode_hits += 1
+            return board_tensor
+        self.encode_misses += 1
+        board_tensor = encoder.encode_batch([game_state])[0]
+        self._put(key, board_tensor)
+        return board_tensor
+
+    def predict(self, model, encoder, game_state):
+        # Returns the encoded position and model.predict on a batch of
+        # just that position. Outputs are cached per model object; call
+        # clear_outputs() when its weights change.
+        board_tensor = self.encode(encoder, game_state)
+        if not self.cache_outputs:
+            return board_tensor, model.predict(board_tensor[np.newaxis])
+        key = ('outputs', self._model_token(model), encoder_key(encoder),
+               position_key(game_state))
+        outputs = self._get(key)
+        if outputs is not None:
+            self.output_hits += 1
+            return board_tensor, outputs
+        self.output_misses += 1
+        outputs = model.predict(board_tensor[np.newaxis])
+        self._put(key, outputs)
+        return board_tensor, outputs
+
+    def _model_token(self, model):
+        token = self._model_tokens.get(id(model))
+        if token is None:
+            token = self._model_tokens[id(model)] = next(self._next_token)
+            weakref.finalize(model, self._forget_model, id(model), token)
+        return token
+
+    def _forget_model(self, model_id, token):
+        # The model is gone: drop its outputs before its id can be
+        # handed to another one.
+        del self._model_tokens[model_id]
+        for key in [key for key in self._entries
+                    if key[0] == 'outputs' and key[1] == token]:
+            self._evict(key)
+
+    def clear_outputs(self):
+        for key in [key for key in self._entries if key[0] == 'outputs']:
+            self._evict(key)
+
+    def clear(self):
+        self._entries.clear()
+        self.num_bytes = 0
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def _put(self, key, value):
+        arrays = value if isinstance(value, (list, tuple)) else [value]
+        num_bytes = 0
+        for array in arrays:
+            array.setflags(write=False)
+            num_bytes += array.nbytes
+        self._entries[key] = (value, num_bytes)
+        self.num_bytes += num_bytes
+        while self.num_bytes > self.max_bytes and self._entries:
+            self._evict(next(iter(self._entries)))
+            self.num_evictions += 1
+
+    def _evict(self, key):
+        _, num_bytes = self._entries.pop(key)
+        self.num_bytes -= num_bytes
+
+    def encode_hit_rate(self):
+        lookups = self.encode_hits + self.encode_misses
+        return self.encode_hits / lookups if lookups else 0.0
+
+    def output_hit_rate(self):
+        lookups = self.output_hits + self.output_misses
+        return self.output_hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self.num_bytes,
+            'evictions': self.num_evictions,
+            'encode_hits': self.encode_hits,
+            'encode_misses': self.encode_misses,
+            'encode_hit_rate': self.encode_hit_rate(),
+            'output_hits': self.output_hits,
+            'output_misses': self.output_misses,
+            'output_hit_rate': self.output_hit_rate(),
+        }
+
+    def log(self):
+        print('Position cache: %d entries, %.1f MB, %d evictions, '
+              'encode hit rate %.3f, output hit rate %.3f' % (
+                  len(self._entries), self.num_bytes / (1024 * 1024),
+                  self.num_evictions, self.encode_hit_rate(),
+                  self.output_hit_rate()))
+
+_shared_cache = None
+
+def shared_position_cache(**kwargs):
+    # The cache for all agents in this process; kwargs only take effect
+    # on the first call, which creates it.
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = PositionCache(**kwargs)
+    return _shared_cache
@@ -4,6 +4,9 @@ from dlgo.encoders.base import Encoder
 from dlgo.goboard import Point
 
 class OnePlaneEncoder(Encoder):
+    # opponent stones are -1
+    dtype = np.int8
+
     def __init__(self, board_size):
         self.board_width, self.board_height = board_size
         self.num_planes = 1
@@ -12,19 +15,18 @@ class OnePlaneEncoder(Encoder):
         return 'oneplane'
 
     def encode(self, game_state):
-        board_matrix = np.zeros(self.shape())
-        next_player = game_state.next_player
-        for r in range(self.board_height):
-            for c in range(self.board_width):
-                p = Point(row=r + 1, col=c + 1)
-                go_string = game_state.board.get_go_string(p)
-                if go_string is None:
-                    continue
-                if go_string.color == next_player:
-                    board_matrix[0, r, c] = 1
-                else:
-                    board_matrix[0, r, c] = -1
-        return board_matrix
+        return self.encode_batch([game_state], dtype=np.float64)[0]
+
+    def encode_batch(self, game_states, out=None, dtype=None):
+        out = self.batch_buffer(game_states, out, dtype)
+        for board_matrix, game_state in zip(out, game_states):
+            colors = game_state.board.color_array()
+            board_matrix[0][colors == game_state.next_player.value] = 1
+            board_matrix[0][colors == game_state.next_player.other.value] = -1
+        return out
+
+    def pack(self, tensors):
+        raise ValueError('oneplane features hold -1 and cannot be bit-packed')
 
     def encode_point(self, point):
         return self.board_width * (point.row - 1) + (point.col - 1)
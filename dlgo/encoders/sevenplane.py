@@ -1,7 +1,8 @@
 import numpy as np
 
 from dlgo.encoders.base import Encoder
-from dlgo.goboard import Move, Point
+from dlgo.encoders.utils import ko_plane
+from dlgo.gotypes import Point
 
 class SevenPlaneEncoder(Encoder):
     def __init__(self, board_size):
@@ -12,24 +13,18 @@ class SevenPlaneEncoder(Encoder):
         return 'sevenplane'
 
     def encode(self, game_state):
-        board_tensor = np.zeros(self.shape())
-        base_plane = {
-            game_state.next_player: 0,
-            game_state.next_player.other: 3
-        }
-        for row in range(self.board_height):
-            for col in range(self.board_width):
-                p = Point(row=row + 1, col=col + 1)
-                go_string = game_state.board.get_go_string(p)
-                if go_string is None:
-                    if game_state.does_move_violate_ko(game_state.next_player,
-                                                        Move.play(p)):
-                        board_tensor[6][row][col] = 1
-                else:
-                    liberty_plane = min(3, go_string.num_liberties) - 1
-                    liberty_plane += base_plane[go_string.color]
-                    board_tensor[liberty_plane][row][col] = 1
-        return board_tensor
+        return self.encode_batch([game_state], dtype=np.float64)[0]
+
+    def encode_batch(self, game_states, out=None, dtype=None):
+        out = self.batch_buffer(game_states, out, dtype)
+        for board_tensor, game_state in zip(out, game_states):
+            colors = game_state.board.color_array()
+            rows, cols = np.nonzero(colors)
+            liberty_plane = np.minimum(game_state.board.liberty_array()[rows, cols], 3) - 1
+            liberty_plane[colors[rows, cols] != game_state.next_player.value] += 3
+            board_tensor[liberty_plane, rows, cols] = 1
+            board_tensor[6] = ko_plane(game_state)
+        return out
 
     def encode_point(self, point):
         return self.board_width * (point.row - 1) + (point.col - 1)
@@ -1,7 +1,7 @@
 import numpy as np
 
 from dlgo.encoders.base import Encoder
-from dlgo.goboard import Move
+from dlgo.encoders.utils import ko_plane
 from dlgo.gotypes import Player, Point
 
 class SimpleEncoder(Encoder):
@@ -13,25 +13,22 @@ class SimpleEncoder(Encoder):
         return 'simple'
 
     def encode(self, game_state):
-        board_tensor = np.zeros(self.shape())
-        if game_state.next_player == Player.black:
-            board_tensor[8] = 1
-        else:
-            board_tensor[9] = 1
-        for r in range(self.board_height):
-            for c in range(self.board_width):
-                p = Point(row=r + 1, col=c + 1)
-                go_string = game_state.board.get_go_string(p)
-                if go_string is None:
-                    if game_state.does_move_violate_ko(game_state.next_player,
-                                                    Move.play(p)):
-                        board_tensor[10][r][c] = 1
-                else:
-                    liberty_plane = min(4, go_string.num_liberties) - 1
-                    if go_string.color == Player.white:
-                        liberty_plane += 4
-                    board_tensor[liberty_plane][r][c] = 1
-        return board_tensor
+        return self.encode_batch([game_state], dtype=np.float64)[0]
+
+    def encode_batch(self, game_states, out=None, dtype=None):
+        out = self.batch_buffer(game_states, out, dtype)
+        for board_tensor, game_state in zip(out, game_states):
+            if game_state.next_player == Player.black:
+                board_tensor[8] = 1
+            else:
+                board_tensor[9] = 1
+            colors = game_state.board.color_array()
+            rows, cols = np.nonzero(colors)
+            liberty_plane = np.minimum(game_state.board.liberty_array()[rows, cols], 4) - 1
+            liberty_plane[colors[rows, cols] == Player.white.value] += 4
+            board_tensor[liberty_plane, rows, cols] = 1
+            board_tensor[10] = ko_plane(game_state)
+        return out
 
     def encode_point(self, point):
         return self.board_width * (point.row - 1) + (point.col - 1)
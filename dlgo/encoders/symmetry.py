@@ -0,0 +1,46 @@
+import numpy as np
+
+__all__ = [
+    'augment_batch',
+    'board_symmetries',
+]
+
+_symmetries = {}
+
+def board_symmetries(num_rows, num_cols):
+    # One row per symmetry of the board: the point index, row by row as
+    # in encode_point, that each point takes its value from. All eight
+    # for a square board, only the four that keep the shape otherwise.
+    key = (num_rows, num_cols)
+    if key not in _symmetries:
+        points = np.arange(num_rows * num_cols).reshape(num_rows, num_cols)
+        grids = []
+        for grid in (points, points.T):
+            if grid.shape != points.shape:
+                continue
+            grids += [grid, grid[::-1], grid[:, ::-1], grid[::-1, ::-1]]
+        _symmetries[key] = np.array([grid.ravel() for grid in grids])
+    return _symmetries[key]
+
+def augment_batch(features, move_vectors=None, symmetries=None):
+    # Applies a symmetry of the board to each encoded position in
+    # features, of shape (batch, planes, rows, cols), and to its row of
+    # move_vectors: move labels, policy targets or visit counts indexed
+    # by point. Entries past the points, like the pass move, are kept.
+    # The symmetries are random unless given as an index per sample.
+    # Returns new arrays.
+    batch_size, num_planes, num_rows, num_cols = features.shape
+    num_points = num_rows * num_cols
+    table = board_symmetries(num_rows, num_cols)
+    if symmetries is None:
+        symmetries = np.random.randint(len(table), size=batch_size)
+    sources = table[symmetries]
+    flat = features.reshape(batch_size, num_planes, num_points)
+    features = np.take_along_axis(flat, sources[:, np.newaxis, :], axis=2) \
+        .reshape(batch_size, num_planes, num_rows, num_cols)
+    if move_vectors is None:
+        return features, None
+    move_vectors = move_vectors.copy()
+    move_vectors[:, :num_points] = np.take_along_axis(
+        move_vectors[:, :num_points], sources, axis=1)
+    return features, move_vectors
@@ -1,84 +1,35 @@
+import numpy as np
+
 from dlgo.goboard import Move
+from dlgo.gotypes import Point
+from dlgo.ladders import LadderReader
+
+def ko_plane(game_state):
+    board = game_state.board
+    plane = np.zeros((board.num_rows, board.num_cols))
+    for r, c in ko_points(game_state):
+        plane[r, c] = 1
+    return plane
+
+def ko_points(game_state):
+    # The (row, col) indices of the points where the player to move may
+    # not play because of ko or superko. Only a capture can repeat a
+    # position, and a capture needs an opponent string in atari next to
+    # the point, so those are the only points worth probing.
+    board = game_state.board
+    colors = board.color_array()
+    player = game_state.next_player
+    in_atari = np.pad(
+        (colors == player.other.value) & (board.liberty_array() == 1), 1)
+    next_to_atari = in_atari[:-2, 1:-1] | in_atari[2:, 1:-1] | \
+        in_atari[1:-1, :-2] | in_atari[1:-1, 2:]
+    return [(r, c) for r, c in zip(*np.nonzero(next_to_atari & (colors == 0)))
+            if game_state.does_move_violate_ko(player, Move.play(Point(r + 1, c + 1)))]
 
 def is_ladder_capture(game_state, candidate, recursion_depth=50):
-    return is_ladder(True, game_state, candidate, None, recursion_depth)
+    captures, _ = LadderReader(max_depth=recursion_depth).read(game_state)
+    return candidate in captures
 
 def is_ladder_escape(game_state, candidate, recursion_depth=50):
-    return is_ladder(False, game_state, candidate, None, recursion_depth)
-
-def is_ladder(try_capture, game_state, candidate,
-              ladder_stones=None, recursion_depth=50):
-
-    if not game_state.is_valid_move(Move(candidate)) or not recursion_depth:
-        return False
-
-    next_player = game_state.next_player
-    capture_player = next_player if try_capture else next_player.other
-    escape_player = capture_player.other
-
-    if ladder_stones is None:
-        ladder_stones = guess_ladder_stones(game_state, candidate, escape_player)
-
-    for ladder_stone in ladder_stones:
-        current_state = game_state.apply_move(candidate)
-
-        if try_capture:
-            candidates = determine_escape_candidates(
-                game_state, ladder_stone, capture_player)
-            attempted_escapes = [  # now try to escape
-                is_ladder(False, current_state, escape_candidate,
-                          ladder_stone, recursion_depth - 1)
-                for escape_candidate in candidates]
-
-            if not any(attempted_escapes):
-                return True  # if at least one escape fails, we capture
-        else:
-            if count_liberties(current_state, ladder_stone) >= 3:
-                return True  # successful escape
-            if count_liberties(current_state, ladder_stone) == 1:
-                continue  # failed escape, others might still do
-            candidates = liberties(current_state, ladder_stone)
-            attempted_captures = [  # now try to capture
-                is_ladder(True, current_state, capture_candidate,
-                          ladder_stone, recursion_depth - 1)
-                for capture_candidate in candidates]
-            if any(attempted_captures):
-                continue  # failed escape, try others
-            return True  # candidate can't be caught in a ladder, escape.
-    return False  # no captures / no escapes
-
-def is_candidate(game_state, move, player):
-    return game_state.next_player == player and \
-        count_liberties(game_state, move) == 2
-
-def guess_ladder_stones(game_state, move, escape_player):
-    adjacent_strings = [game_state.board.get_go_string(nb) for nb in move.neighbors() if game_state.board.get_go_string(nb)]
-    if adjacent_strings:
-        string = adjacent_strings[0]
-        neighbors = []
-        for string in adjacent_strings:
-            stones = string.stones
-            for stone in stones:
-                neighbors.append(stone)
-        return [Move(nb) for nb in neighbors if is_candidate(game_state, Move(nb), escape_player)]
-    else:
-        return []
-
-def determine_escape_candidates(game_state, move, capture_player):
-    escape_candidates = move.neighbors()
-    for other_ladder_stone in game_state.board.get_go_string(move).stones:
-        for neighbor in other_ladder_stone.neighbors():
-            right_color = game_state.color(neighbor) == capture_player
-            one_liberty = count_liberties(game_state, neighbor) == 1
-            if right_color and one_liberty:
-                escape_candidates.append(liberties(game_state, neighbor))
-    return escape_candidates
-
-def count_liberties(game_state, move):
-    if game_state.board.get_go_string(move):
-        return game_state.board.get_go_string(move).num_liberties
-    else:
-        return 0
-
-def liberties(game_state, move):
-    return list(game_state.board.get_go_string(move).liberties)
+    _, escapes = LadderReader(max_depth=recursion_depth).read(game_state)
+    return candidate in escapes
@@ -1,4 +1,7 @@
 import copy
+
+import numpy as np
+
 from dlgo import zobrist
 from dlgo.gotypes import Player
 from dlgo.gotypes import Point
@@ -10,10 +13,14 @@ class Board():
         self.num_cols = num_cols
         self._grid = {}
         self._hash = zobrist.EMPTY_BOARD
+        self._colors = np.zeros((num_rows, num_cols), dtype=np.int8)
+        self._liberties = np.zeros((num_rows, num_cols), dtype=np.int16)
 
     def _replace_string(self, new_string):
+        num_liberties = new_string.num_liberties
         for point in new_string.stones:
             self._grid[point] = new_string
+            self._liberties[point.row - 1, point.col - 1] = num_liberties
 
     def _remove_string(self, string):
         for point in string.stones:
@@ -24,6 +31,8 @@ class Board():
                 if neighbor_string is not string:
                     self._replace_string(neighbor_string.with_liberty(point))
             self._grid[point] = None
+            self._colors[point.row - 1, point.col - 1] = 0
+            self._liberties[point.row - 1, point.col - 1] = 0
             self._hash ^= zobrist.HASH_CODE[point, string.color]
 
     def zobrist_hash(self):
@@ -50,8 +59,8 @@ class Board():
         new_string = GoString(player, [point], liberties)
         for same_color_string in adjacent_same_color:
             new_string = new_string.merged_with(same_color_string)
-        for new_string_point in new_string.stones:
-            self._grid[new_string_point] = new_string
+        self._colors[point.row - 1, point.col - 1] = player.value
+        self._replace_string(new_string)
         self._hash ^= zobrist.HASH_CODE[point, player]
         for other_color_string in adjacent_opposite_color:
             replacement = other_color_string.without_liberty(point)
@@ -76,6 +85,12 @@ class Board():
             return None
         return string
 
+    def color_array(self):
+        return self._colors
+
+    def liberty_array(self):
+        return self._liberties
+
 class Move():
     def __init__(self, point=None, is_pass=False, is_resign=False):
         assert (point is not None) ^ is_pass ^ is_resign
@@ -211,6 +226,20 @@ class GameState():
     def situation(self):
         return (self.next_player, self.board)
 
+    def ko_point(self):
+        # See goboard_fast.GameState.ko_point.
+        move = self.last_move
+        if move is None or not move.is_play or self.previous_state is None:
+            return None
+        string = self.board.get_go_string(move.point)
+        if len(string.stones) != 1 or string.num_liberties != 1:
+            return None
+        point = next(iter(string.liberties))
+        captured = self.previous_state.board.get_go_string(point)
+        if captured is None or len(captured.stones) != 1:
+            return None
+        return point
+
     def does_move_violate_ko(self, player, move):
         if not move.is_play:
             return False
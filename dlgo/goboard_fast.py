@@ -1,4 +1,7 @@
 import copy
+
+import numpy as np
+
 from dlgo.gotypes import Player, Point
 from dlgo.scoring import compute_game_result
 from dlgo import zobrist
@@ -88,6 +91,11 @@ class Board():
         self.num_cols = num_cols
         self._grid = {}
         self._hash = zobrist.EMPTY_BOARD
+        # array views of the grid for the encoders: the Player value of
+        # the stone on each point (0 if empty), and the liberties of its
+        # string
+        self._colors = np.zeros((num_rows, num_cols), dtype=np.int8)
+        self._liberties = np.zeros((num_rows, num_cols), dtype=np.int16)
 
         global neighbor_tables
         dim = (num_rows, num_cols)
@@ -130,8 +138,8 @@ class Board():
         # 1. merge any adjacent strings of the same color
         for same_color_string in adjacent_same_color:
             new_string = new_string.merged_with(same_color_string)
-        for new_string_point in new_string.stones:
-            self._grid[new_string_point] = new_string
+        self._colors[point.row - 1, point.col - 1] = player.value
+        self._replace_string(new_string)
         # remove empty-point hash code
         self._hash ^= zobrist.HASH_CODE[point, None]
         # Add filled point hash code
@@ -148,12 +156,16 @@ class Board():
                 self._remove_string(other_color_string)
 
     def _replace_string(self, new_string):
+        num_liberties = new_string.num_liberties
         for point in new_string.stones:
             self._grid[point] = new_string
+            self._liberties[point.row - 1, point.col - 1] = num_liberties
 
     def _remove_string(self, string):
         for point in string.stones:
             self.move_ages.reset_age(point)
+            self._colors[point.row - 1, point.col - 1] = 0
+            self._liberties[point.row - 1, point.col - 1] = 0
             # removing a string can create liberties for other strings
             for neighbor in self.neighbor_table[point]:
                 neighbor_string = self._grid.get(neighbor)
@@ -214,6 +226,33 @@ class Board():
             return None
         return string
 
+    def zobrist_hash_after(self, player, point):
+        # The hash place_stone(player, point) would leave behind, without
+        # copying the board to play it.
+        new_hash = self._hash ^ zobrist.HASH_CODE[point, None] ^ \
+            zobrist.HASH_CODE[point, player]
+        captured = []
+        for neighbor in self.neighbor_table[point]:
+            neighbor_string = self._grid.get(neighbor)
+            if neighbor_string is None or neighbor_string.color == player:
+                continue
+            if neighbor_string.num_liberties == 1 and \
+                    not any(neighbor_string is string for string in captured):
+                captured.append(neighbor_string)
+                for stone in neighbor_string.stones:
+                    new_hash ^= zobrist.HASH_CODE[stone, neighbor_string.color] ^ \
+                        zobrist.HASH_CODE[stone, None]
+        return new_hash
+
+    def color_array(self):
+        # Player values by point, indexed [row - 1, col - 1]; 0 for empty
+        # points. Shared with the board, so don't modify it.
+        return self._colors
+
+    def liberty_array(self):
+        # Liberties of the string on each point, 0 for empty points.
+        return self._liberties
+
     def __eq__(self, other):
         return isinstance(other, Board) and \
             self.num_rows == other.num_rows and \
@@ -226,8 +265,29 @@ class Board():
         # (immutable) to GoStrings (also immutable)
         copied._grid = copy.copy(self._grid)
         copied._hash = self._hash
+        copied._colors = self._colors.copy()
+        copied._liberties = self._liberties.copy()
+        copied.move_ages.move_ages = self.move_ages.move_ages.copy()
         return copied
 
+    def __getstate__(self):
+        # the neighbor and corner tables are shared per board size, so
+        # don't ship them along when a board is pickled
+        state = self.__dict__.copy()
+        del state['neighbor_table']
+        del state['corner_table']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        dim = (self.num_rows, self.num_cols)
+        if dim not in neighbor_tables:
+            init_neighbor_table(dim)
+        if dim not in corner_tables:
+            init_corner_table(dim)
+        self.neighbor_table = neighbor_tables[dim]
+        self.corner_table = corner_tables[dim]
+
     def zobrist_hash(self):
         return self._hash
 
@@ -304,6 +364,17 @@ class GameState():
         board = Board(*board_size)
         return GameState(board, Player.black, None, None)
 
+    def detached(self):
+        # Same position, ko history and last two moves, but without the
+        # rest of the game record. Cheap to pickle, e.g. for a worker
+        # process.
+        previous = self.previous_state
+        if previous is not None:
+            previous = GameState(previous.board, previous.next_player, None, previous.last_move)
+        detached = GameState(self.board, self.next_player, previous, self.last_move)
+        detached.previous_states = self.previous_states
+        return detached
+
     def is_move_self_capture(self, player, move):
         if not move.is_play:
             return False
@@ -313,14 +384,33 @@ class GameState():
     def situation(self):
         return (self.next_player, self.board)
 
+    def ko_point(self):
+        # The point the player to move can't play on because it would
+        # take back a ko, or None. Every string a move captures touches
+        # the move, so if the stone just played is alone and its only
+        # liberty is where an opponent stone stood, it took exactly that
+        # one stone.
+        move = self.last_move
+        if move is None or not move.is_play or self.previous_state is None:
+            return None
+        string = self.board.get_go_string(move.point)
+        if len(string.stones) != 1 or string.num_liberties != 1:
+            return None
+        point = next(iter(string.liberties))
+        captured = self.previous_state.board.get_go_string(point)
+        if captured is None or len(captured.stones) != 1:
+            return None
+        return point
+
     def does_move_violate_ko(self, player, move):
         if not move.is_play:
             return False
+        if player == self.next_player and move.point == self.ko_point():
+            return True
         if not self.board.will_capture(player, move.point):
             return False
-        next_board = copy.deepcopy(self.board)
-        next_board.place_stone(player, move.point)
-        next_situation = (player.other, next_board.zobrist_hash())
+        # any other capture can still repeat an older position
+        next_situation = (player.other, self.board.zobrist_hash_after(player, move.point))
         return next_situation in self.previous_states
 
     def is_valid_move(self, move):
@@ -0,0 +1,224 @@
+from dlgo import zobrist
+from dlgo.gotypes import Player, Point
+
+__all__ = [
+    'LadderReader',
+]
+
+EMPTY = 0
+EDGE = 3
+
+
+class _LadderBoard:
+    # A mutable copy of the stones on a padded board, numbered row by row
+    # with a border of EDGE points, so that the neighbors of i are i - 1,
+    # i + 1, i - width and i + width. Moves are made and unmade in place
+    # and the Zobrist hash is kept in step with goboard_fast.Board's.
+    def __init__(self, game_state):
+        board = game_state.board
+        self.num_rows = board.num_rows
+        self.num_cols = board.num_cols
+        self.width = width = board.num_cols + 2
+        self.colors = [EDGE] * (width * (board.num_rows + 2))
+        self.hash = board.zobrist_hash()
+        self._codes = {}
+        for r, row in enumerate(board.color_array().tolist()):
+            for c, color in enumerate(row):
+                self.colors[(r + 1) * width + c + 1] = color
+
+    def index(self, point):
+        return point.row * self.width + point.col
+
+    def point(self, idx):
+        return Point(row=idx // self.width, col=idx % self.width)
+
+    def neighbors(self, idx):
+        return idx - 1, idx + 1, idx - self.width, idx + self.width
+
+    def string(self, idx):
+        # The stones and liberties of the string on idx.
+        colors = self.colors
+        color = colors[idx]
+        stones = [idx]
+        seen = {idx}
+        liberties = set()
+        for stone in stones:
+            for neighbor in self.neighbors(stone):
+                neighbor_color = colors[neighbor]
+                if neighbor_color == EMPTY:
+                    liberties.add(neighbor)
+                elif neighbor_color == color and neighbor not in seen:
+                    seen.add(neighbor)
+                    stones.append(neighbor)
+        return stones, liberties
+
+    def liberties(self, idx):
+        return self.string(idx)[1]
+
+    def _toggle(self, idx, color):
+        # xor a stone of color on idx in or out of the hash
+        key = (idx, color)
+        code = self._codes.get(key)
+        if code is None:
+            point = self.point(idx)
+            player = Player(color)
+            code = self._codes[key] = \
+                zobrist.HASH_CODE[point, None] ^ zobrist.HASH_CODE[point, player]
+        self.hash ^= code
+
+    def make(self, color, idx):
+        # Plays color on idx. Returns the captured stones to hand to
+        # unmake, or None, leaving the board as it was, for a suicide.
+        colors = self.colors
+        other = Player.black.value + Player.white.value - color
+        colors[idx] = color
+        self._toggle(idx, color)
+        captured = []
+        for neighbor in self.neighbors(idx):
+            if colors[neighbor] != other:
+                continue
+            stones, liberties = self.string(neighbor)
+            if liberties:
+                continue
+            for stone in stones:
+                colors[stone] = EMPTY
+                self._toggle(stone, other)
+            captured.extend(stones)
+        if not captured and not self.liberties(idx):
+            colors[idx] = EMPTY
+            self._toggle(idx, color)
+            return None
+        return captured
+
+    def unmake(self, color, idx, captured):
+        other = Player.black.value + Player.white.value - color
+        for stone in captured:
+            self.colors[stone] = other
+            self._toggle(stone, other)
+        self.colors[idx] = EMPTY
+        self._toggle(idx, color)
+
+
+class LadderReader:
+    # Reads ladders for the player to move: which points start a ladder
+    # that captures an opponent string, and which let one of our strings
+    # in atari escape. The chase is played out on one mutable board with
+    # make/unmake, and only the liberties of the chased string and its
+    # neighbors are looked at. Results are remembered by the chased
+    # string, position hash and remaining depth, across calls too: with
+    # the chase free to take kos back and forth, a result can depend on
+    # how deep the cutoff lies. Like RolloutState, only the ko at the
+    # root is respected.
+    def __init__(self, max_depth=100, max_memo_size=100000):
+        self.max_depth = max_depth
+        self.max_memo_size = max_memo_size
+        self._memo = {}
+
+    def read(self, game_state):
+        # Returns the set of ladder capture points and the set of ladder
+        # escape points for game_state.next_player.
+        board = _LadderBoard(game_state)
+        color = game_state.next_player.value
+        other = game_state.next_player.other.value
+        ko_point = game_state.ko_point()
+        forbidden = None if ko_point is None else board.index(ko_point)
+        colors = board.colors
+        captures = set()
+        escapes = set()
+        seen = set()
+        for idx, stone_color in enumerate(colors):
+            if stone_color not in (color, other) or idx in seen:
+                continue
+            stones, liberties = board.string(idx)
+            seen.update(stones)
+            if stone_color == other and len(liberties) == 2:
+                for liberty in liberties:
+                    if liberty != forbidden and liberty not in captures and \
+                            self._atari_captures(board, color, liberty, idx):
+                        captures.add(liberty)
+            elif stone_color == color and len(liberties) == 1:
+                for candidate in self._escape_moves(board, idx, liberties):
+                    if candidate != forbidden and candidate not in escapes and \
+                            self._move_escapes(board, color, candidate, idx, 0):
+                        escapes.add(candidate)
+        return set(map(board.point, captures)), set(map(board.point, escapes))
+
+    def _escape_moves(self, board, prey, liberties):
+        # Extending at the last liberty, or capturing one of the
+        # surrounding strings that is in atari itself.
+        colors = board.colors
+        color = colors[prey]
+        candidates = set(liberties)
+        stones, _ = board.string(prey)
+        for stone in stones:
+            for neighbor in board.neighbors(stone):
+                if colors[neighbor] not in (EMPTY, EDGE, color):
+                    neighbor_liberties = board.liberties(neighbor)
+                    if len(neighbor_liberties) == 1:
+                        candidates |= neighbor_liberties
+        return candidates
+
+    def _atari_captures(self, board, color, idx, prey):
+        # Does color playing idx put prey in atari without letting it
+        # escape?
+        captured = board.make(color, idx)
+        if captured is None:
+            return False
+        liberties = board.liberties(prey)
+        result = len(liberties) == 1 and not self._escapes(board, prey, 1)
+        board.unmake(color, idx, captured)
+        return result
+
+    def _escapes(self, board, prey, depth):
+        # prey is in atari and its owner is to move.
+        key = ('escape', prey, board.hash, self.max_depth - depth)
+        if key in self._memo:
+            return self._memo[key]
+        if depth >= self.max_depth:
+            return True
+        color = board.colors[prey]
+        result = any(
+            self._move_escapes(board, color, candidate, prey, depth)
+            for candidate in self._escape_moves(board, prey, board.liberties(prey)))
+        self._remember(key, result)
+        return result
+
+    def _move_escapes(self, board, color, idx, prey, depth):
+        captured = board.make(color, idx)
+        if captured is None:
+            return False
+        num_liberties = len(board.liberties(prey))
+        if num_liberties >= 3:
+            result = True
+        elif num_liberties == 2:
+            result = not self._captures(board, prey, depth + 1)
+        else:
+            result = False
+        board.unmake(color, idx, captured)
+        return result
+
+    def _captures(self, board, prey, depth):
+        # prey has two liberties and the chaser is to move.
+        key = ('capture', prey, board.hash, self.max_depth - depth)
+        if key in self._memo:
+            return self._memo[key]
+        if depth >= self.max_depth:
+            return False
+        chaser = Player.black.value + Player.white.value - board.colors[prey]
+        result = False
+        for liberty in board.liberties(prey):
+            captured = board.make(chaser, liberty)
+            if captured is None:
+                continue
+            in_atari = len(board.liberties(prey)) == 1
+            result = in_atari and not self._escapes(board, prey, depth + 1)
+            board.unmake(chaser, liberty, captured)
+            if result:
+                break
+        self._remember(key, result)
+        return result
+
+    def _remember(self, key, result):
+        if len(self._memo) >= self.max_memo_size:
+            self._memo.clear()
+        self._memo[key] = result
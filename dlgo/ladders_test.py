@@ -0,0 +1,44 @@
+import unittest
+
+from dlgo.goboard_fast import Board, GameState
+from dlgo.gotypes import Player, Point
+from dlgo.ladders import LadderReader
+
+
+def game_from_rows(rows, next_player):
+    # rows from the top of the board down, x for black and o for white
+    board = Board(len(rows), len(rows[0]))
+    for i, row in enumerate(rows):
+        for j, stone in enumerate(row):
+            if stone != '.':
+                player = Player.black if stone == 'x' else Player.white
+                board.place_stone(player, Point(len(rows) - i, j + 1))
+    return GameState(board, next_player, None, None)
+
+
+class LadderReaderTest(unittest.TestCase):
+    def test_ko_inside_ladder(self):
+        # White G3 puts the three black stones in atari and black G1
+        # takes two stones back, so the chase turns into a ko fight that
+        # only ends at the depth cutoff. Reading the position after G3
+        # first runs into the same positions one move shallower.
+        rows = [
+            '.......',
+            '.......',
+            '.......',
+            '.......',
+            '....oo.',
+            '...oxxx',
+            '...xoo.',
+        ]
+        game = game_from_rows(rows, Player.white)
+        rows[4] = '....ooo'
+        after_atari = game_from_rows(rows, Player.black)
+
+        reader = LadderReader(max_depth=3)
+        reader.read(after_atari)
+        self.assertEqual(LadderReader(max_depth=3).read(game), reader.read(game))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,11 @@
 import math
 import random
 
+import numpy as np
+
 from dlgo import agent
+from dlgo.agent.stats import SearchStats, estimate_bytes, game_state_bytes
+from dlgo.mcts.playouts import random_playouts
 from dlgo.gotypes import Player
 from dlgo.utils import coords_from_point
 
@@ -9,103 +13,469 @@ __all__ = [
     'MCTSAgent',
 ]
 
+def transposition_key(game_state):
+    # The zobrist hash and player to move identify the position; the
+    # pass flags keep apart positions where a pass would end the game,
+    # and finished games.
+    last_move = game_state.last_move
+    return (game_state.board.zobrist_hash(),
+            game_state.next_player,
+            last_move is not None and last_move.is_pass,
+            game_state.is_over())
+
+class StateCache(object):
+    # Keeps count of the game states held by the nodes of one search
+    # tree, so that we can put a cap on them, and of the legal moves
+    # the expanded nodes hold.
+    def __init__(self, capacity=None):
+        self.capacity = capacity
+        self.size = 0
+        self.num_moves = 0
+
+    def has_room(self):
+        return self.capacity is None or self.size < self.capacity
+
 class MCTSNode(object):
-    def __init__(self, game_state, parent=None, move=None):
-        self.game_state = game_state
+    def __init__(self, game_state=None, parent=None, move=None, cache=None):
+        # Apart from the root, a node only knows how it was reached. Its
+        # game state is rebuilt from the parent when needed, and kept
+        # once the node gets expanded, if the cache has room for it.
+        self._game_state = game_state
         self.parent = parent
         self.move = move
+        if parent is None:
+            self.next_player = game_state.next_player
+            self._cache = cache if cache is not None else StateCache()
+            self._cache.size += 1
+        else:
+            self.next_player = parent.next_player.other
+            self._cache = parent._cache
         self.win_counts = {
             Player.black: 0,
             Player.white: 0,
         }
         self.num_rollouts = 0
         self.children = []
+        # With a transposition table a child can be shared with other
+        # parents, so the move leading to it is kept here per parent.
+        self.child_moves = []
+        # legal moves are only generated once we expand the node
+        self.univisted_moves = None
+        self._is_terminal = None
+        self.table_key = None
+        # all-moves-as-first statistics for the player to move here,
+        # by point
+        self.amaf_wins = {}
+        self.amaf_rollouts = {}
+        # for the solver: the winner, once the result here is certain
+        self.proven_winner = None
+
+    @property
+    def game_state(self):
+        if self._game_state is not None:
+            return self._game_state
+        return self.parent.game_state.apply_move(self.move)
+
+    def _expand(self):
+        game_state = self.game_state
+        if self._game_state is None and self._cache.has_room():
+            self._game_state = game_state
+            self._cache.size += 1
         self.univisted_moves = game_state.legal_moves()
+        self._cache.num_moves += len(self.univisted_moves)
+        self._is_terminal = game_state.is_over()
 
-    def add_random_child(self):
+    def add_random_child(self, table=None):
+        # Returns the new child together with its game state, which the
+        # child itself doesn't keep.
+        if self.univisted_moves is None:
+            self._expand()
         index = random.randint(0, len(self.univisted_moves) - 1)
         new_move = self.univisted_moves.pop(index)
         new_game_state = self.game_state.apply_move(new_move)
-        new_node = MCTSNode(new_game_state, self, new_move)
+        new_node = None
+        if table is not None:
+            key = transposition_key(new_game_state)
+            new_node = table.get(key)
+        if new_node is None:
+            new_node = MCTSNode(parent=self, move=new_move)
+            if table is not None:
+                new_node.table_key = key
+                table[key] = new_node
         self.children.append(new_node)
-        return new_node
+        self.child_moves.append(new_move)
+        return new_node, new_game_state
+
+    def remove_child(self, child):
+        # The child's rollouts stay counted here; its move can be tried
+        # again later.
+        index = self.children.index(child)
+        self.univisted_moves.append(self.child_moves[index])
+        del self.children[index]
+        del self.child_moves[index]
+
+    def release_state(self):
+        if self._game_state is not None and self.parent is not None:
+            self._game_state = None
+            self._cache.size -= 1
 
     def record_win(self, winner):
         self.win_counts[winner] += 1
         self.num_rollouts += 1
 
+    def record_wins(self, win_counts):
+        for player, count in win_counts.items():
+            self.win_counts[player] += count
+            self.num_rollouts += count
+
+    def update_proof(self):
+        # A position is won for the player to move if one move wins, and
+        # lost once every move has been tried and loses.
+        player = self.next_player
+        if any(child.proven_winner == player for child in self.children):
+            self.proven_winner = player
+        elif self.univisted_moves is not None and not self.univisted_moves and \
+                self.children and \
+                all(child.proven_winner == player.other for child in self.children):
+            self.proven_winner = player.other
+        return self.proven_winner is not None
+
+    def record_amaf(self, first_players, winner):
+        # first_players maps each point played after this node to the
+        # player who played it first.
+        player = self.next_player
+        for point, first_player in first_players.items():
+            if first_player != player:
+                continue
+            self.amaf_rollouts[point] = self.amaf_rollouts.get(point, 0) + 1
+            if winner == player:
+                self.amaf_wins[point] = self.amaf_wins.get(point, 0) + 1
+
     def can_add_child(self):
+        if self.univisted_moves is None:
+            self._expand()
         return len(self.univisted_moves) > 0
 
     def is_terminal(self):
-        return self.game_state.is_over()
+        if self._is_terminal is None:
+            self._expand()
+        return self._is_terminal
 
     def winning_frac(self, player):
         return float(self.win_counts[player]) / float(self.num_rollouts)
 
+    def own_bytes(self):
+        # The memory of the node itself, without its game state and the
+        # nodes around it.
+        return estimate_bytes(
+            self, [self._game_state, self.parent, self._cache] + self.children)
+
+def iter_tree(root):
+    # Every node below root once, also when it's shared between parents.
+    seen = {id(root)}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        for child in node.children:
+            if id(child) not in seen:
+                seen.add(id(child))
+                stack.append(child)
+
 class MCTSAgent(agent.Agent):
-    def __init__(self, num_rounds, temperature):
+    def __init__(self, num_rounds, temperature, use_transpositions=False,
+                 stop_check_interval=50, max_cached_states=None,
+                 max_tree_bytes=None, rave=False, rave_equivalence=1000,
+                 solver=False, playouts_per_leaf=1):
         agent.Agent.__init__(self)
         self.num_rounds = num_rounds
         self.temperature = temperature
+        self.use_transpositions = use_transpositions
+        self.stop_check_interval = stop_check_interval
+        self.max_cached_states = max_cached_states
+        self.max_tree_bytes = max_tree_bytes
+        self.rave = rave
+        self.rave_equivalence = rave_equivalence
+        self.solver = solver
+        if rave and playouts_per_leaf > 1:
+            raise ValueError('RAVE needs the moves of single rollouts')
+        self.playouts_per_leaf = playouts_per_leaf
+        self._stats = None
 
     def select_move(self, game_state):
-        root = MCTSNode(game_state)
+        stats = self._stats = SearchStats()
+        cache = StateCache(self.max_cached_states)
+        root = MCTSNode(game_state, cache=cache)
+        stats.nodes_allocated += 1
+        table = None
+        if self.use_transpositions:
+            table = {transposition_key(game_state): root}
+        num_nodes = 1
+        stats.extra['pruned_nodes'] = 0
+        # The tree's memory is estimated from the size of a node, of a
+        # legal move kept by an expanded node, and of a game state, all
+        # measured on the root.
+        node_bytes = root.own_bytes()
+        root.can_add_child()
+        move_bytes = (root.own_bytes() - node_bytes) / max(cache.num_moves, 1)
+        state_bytes = game_state_bytes(game_state)
+
+        def tree_bytes():
+            return int(num_nodes * node_bytes + cache.num_moves * move_bytes +
+                       cache.size * state_bytes)
 
         for i in range(self.num_rounds):
-            node = root
-            while (not node.can_add_child()) and (not node.is_terminal()):
-                node = self.select_child(node)
+            with stats.timer('selection'):
+                node = root
+                path = [root]
+                path_moves = []
+                while (not node.can_add_child()) and (not node.is_terminal()):
+                    child, move = self.select_child(node)
+                    if child is None or child in path:
+                        # every move here is proven, or we went round in
+                        # a circle through a shared node
+                        break
+                    path_moves.append((node.next_player, move))
+                    node = child
+                    path.append(node)
 
-            if node.can_add_child():
-                node = node.add_random_child()
+                rollout_state = None
+                if node.can_add_child():
+                    parent = node
+                    node, rollout_state = parent.add_random_child(table)
+                    if node.num_rollouts == 0:
+                        stats.nodes_allocated += 1
+                        num_nodes += 1
+                        if self.solver and rollout_state.is_over():
+                            node.proven_winner = rollout_state.winner()
+                    else:
+                        stats.cache_hits += 1
+                    if node not in path:
+                        path_moves.append((parent.next_player, parent.child_moves[-1]))
+                        path.append(node)
 
-            winner = self.simulate_random_game(node.game_state)
+            if self.solver and node.proven_winner is None:
+                node.update_proof()
+            num_playouts = self.playouts_per_leaf
+            rollout_moves = [] if self.rave else None
+            if node.proven_winner is not None:
+                # no need for rollouts when we know the result
+                winner = node.proven_winner
+                win_counts = {winner: num_playouts, winner.other: 0}
+            else:
+                with stats.timer('rollout'):
+                    if rollout_state is None:
+                        rollout_state = node.game_state
+                    if num_playouts > 1:
+                        win_counts = random_playouts(rollout_state, num_playouts)
+                    else:
+                        winner = self.simulate_random_game(rollout_state, rollout_moves)
+                        win_counts = {winner: 1, winner.other: 0}
 
-            while node is not None:
-                node.record_win(winner)
-                node = node.parent
+            # back up along the path we actually took; with transpositions
+            # a node's parent pointer is just the first way we found it
+            with stats.timer('backup'):
+                for node in path:
+                    node.record_wins(win_counts)
+                if self.rave:
+                    self.record_amaf(path, path_moves, rollout_moves, winner)
+                if self.solver and node.proven_winner is not None:
+                    for parent in reversed(path[:-1]):
+                        if parent.proven_winner is None and not parent.update_proof():
+                            break
+            stats.simulations += 1
+            stats.record_depth(len(path) - 1)
+            if root.proven_winner is not None:
+                break
+
+            if self.max_tree_bytes is not None and tree_bytes() > self.max_tree_bytes:
+                # prune a bit more than needed so we don't do this every round
+                target_size = num_nodes * self.max_tree_bytes * 3 // (4 * tree_bytes())
+                with stats.timer('pruning'):
+                    pruned_size = self.prune_tree(root, table, target_size)
+                stats.extra['pruned_nodes'] += num_nodes - pruned_size
+                num_nodes = pruned_size
+
+            if self.stop_check_interval and \
+                    (i + 1) % self.stop_check_interval == 0 and \
+                    self.is_decided(
+                        root, (self.num_rounds - i - 1) * self.playouts_per_leaf):
+                break
+        stats.extra['unused_rounds'] = self.num_rounds - stats.simulations
+        stats.extra['tree_nodes'] = num_nodes
+        stats.extra['tree_states'] = cache.size
+        stats.extra['tree_bytes'] = tree_bytes()
+        if self.solver:
+            stats.extra['proven_winner'] = None if root.proven_winner is None \
+                else root.proven_winner.name
 
         scored_moves = [
-            (child.winning_frac(game_state.next_player), child.move, child.num_rollouts)
-            for child in root.children
+            (child.winning_frac(game_state.next_player), move, child.num_rollouts)
+            for child, move in zip(root.children, root.child_moves)
         ]
         scored_moves.sort(key=lambda x: x[0], reverse=True)
-        for s, m, n in scored_moves[:10]:
-            print('%s - %.3f (%d)' % (m, s, n))
+        stats.extra['top_moves'] = [
+            {'move': str(m), 'win_pct': float(s), 'rollouts': int(n)}
+            for s, m, n in scored_moves[:10]
+        ]
+
+        player = game_state.next_player
+        for child, move in zip(root.children, root.child_moves):
+            if child.proven_winner == player:
+                stats.finish()
+                return move
+        # stay away from proven losses, unless that's all we have
+        candidates = [
+            (child, move) for child, move in zip(root.children, root.child_moves)
+            if child.proven_winner != player.other
+        ]
+        if not candidates:
+            candidates = list(zip(root.children, root.child_moves))
 
         best_move = None
         best_pct = -1.0
-        for child in root.children:
-            child_pct = child.winning_frac(game_state.next_player)
+        for child, move in candidates:
+            child_pct = child.winning_frac(player)
             if child_pct > best_pct:
                 best_pct = child_pct
-                best_move = child.move
-        print('Select move %s with win pct %.3f' % (best_move, best_pct))
+                best_move = move
+        stats.finish()
         return best_move
 
+    def diagnostics(self):
+        if self._stats is None:
+            return {}
+        return self._stats.to_dict()
+
+    @staticmethod
+    def is_decided(root, remaining_rollouts):
+        # The move is decided if no other move can end up with a better
+        # winning fraction than the leader. A round adds its rollouts at
+        # most once to each node (also with transpositions), so between
+        # them the leader and a challenger get at most remaining_rollouts
+        # more; we try every split, with the leader losing its share and
+        # the challenger winning its share. As in the final choice, a
+        # proven win decides the move, and proven losses can neither lead
+        # nor catch up unless they are all we have.
+        player = root.next_player
+        if any(child.proven_winner == player for child in root.children):
+            return True
+        if root.can_add_child():
+            return False
+        candidates = [child for child in root.children
+                      if child.proven_winner != player.other]
+        if not candidates:
+            candidates = root.children
+        if remaining_rollouts == 0 or len(candidates) < 2:
+            return True
+        by_pct = sorted(candidates,
+                        key=lambda child: child.winning_frac(player),
+                        reverse=True)
+        leader = by_pct[0]
+        challenger_share = np.arange(remaining_rollouts + 1)
+        worst_leader_pct = leader.win_counts[player] / \
+            (leader.num_rollouts + remaining_rollouts - challenger_share)
+        for child in by_pct[1:]:
+            best_child_pct = (child.win_counts[player] + challenger_share) / \
+                (child.num_rollouts + challenger_share)
+            if np.any(best_child_pct >= worst_leader_pct):
+                return False
+        return True
+
+    @staticmethod
+    def prune_tree(root, table, target_size):
+        # Collapse the least visited subtrees into the node above them
+        # until the tree is down to target_size nodes. The root's own
+        # children are kept, as they decide the move. Returns the new
+        # tree size.
+        edges = []
+        num_nodes = 0
+        seen = {id(root)}
+        stack = [(root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            num_nodes += 1
+            for child in node.children:
+                if node is not root:
+                    edges.append((child.num_rollouts, -depth, node, child))
+                if id(child) not in seen:
+                    seen.add(id(child))
+                    stack.append((child, depth + 1))
+        # on equal rollouts take the deeper subtree first, so that we
+        # never remove a subtree from a node we already dropped
+        edges.sort(key=lambda edge: edge[:2])
+        for _, _, parent, child in edges:
+            if num_nodes <= target_size:
+                break
+            parent.remove_child(child)
+            for removed in iter_tree(child):
+                removed.release_state()
+                if removed.table_key is not None and \
+                        table.get(removed.table_key) is removed:
+                    del table[removed.table_key]
+                num_nodes -= 1
+        # with transpositions a removed node may still hang elsewhere
+        # in the tree, so count again
+        num_nodes = num_moves = 0
+        for node in iter_tree(root):
+            num_nodes += 1
+            if node.univisted_moves is not None:
+                num_moves += len(node.univisted_moves) + len(node.child_moves)
+        root._cache.num_moves = num_moves
+        return num_nodes
+
+    @staticmethod
+    def record_amaf(path, path_moves, rollout_moves, winner):
+        # Walk back from the end of the simulation, so that at each node
+        # we know who played each point first from there on.
+        first_players = {}
+        for player, move in reversed(rollout_moves):
+            if move.is_play:
+                first_players[move.point] = player
+        for depth in reversed(range(len(path))):
+            if depth < len(path_moves):
+                player, move = path_moves[depth]
+                if move.is_play:
+                    first_players[move.point] = player
+            path[depth].record_amaf(first_players, winner)
+
     def select_child(self, node):
         total_rollouts = sum(child.num_rollouts for child in node.children)
         log_rollouts = math.log(total_rollouts)
 
         best_score = -1
         best_child = None
-        for child in node.children:
-            win_percentage = child.winning_frac(node.game_state.next_player)
+        best_move = None
+        for child, move in zip(node.children, node.child_moves):
+            if child.proven_winner is not None:
+                continue
+            win_percentage = child.winning_frac(node.next_player)
+            if self.rave and move.is_play:
+                amaf_rollouts = node.amaf_rollouts.get(move.point, 0)
+                if amaf_rollouts > 0:
+                    # lean on the AMAF value while the move itself has few
+                    # rollouts, and less and less as it gets more
+                    amaf = float(node.amaf_wins.get(move.point, 0)) / amaf_rollouts
+                    beta = math.sqrt(self.rave_equivalence /
+                                     (3 * child.num_rollouts + self.rave_equivalence))
+                    win_percentage = (1 - beta) * win_percentage + beta * amaf
             exploration_factor = math.sqrt(log_rollouts / child.num_rollouts)
             uct_score = win_percentage + self.temperature * exploration_factor
             if uct_score > best_score:
                 best_score = uct_score
                 best_child = child
-        return best_child
+                best_move = move
+        return best_child, best_move
 
     @staticmethod
-    def simulate_random_game(game):
+    def simulate_random_game(game, moves_played=None):
         bots = {
             Player.black: agent.RandomBot(),
             Player.white: agent.RandomBot()
         }
         while not game.is_over():
             bot_move = bots[game.next_player].select_move(game)
+            if moves_played is not None:
+                moves_played.append((game.next_player, bot_move))
             game = game.apply_move(bot_move)
         return game.winner()
@@ -0,0 +1,262 @@
+import numpy as np
+
+from dlgo.agent.rollout import RolloutState
+from dlgo.gotypes import Player, Point
+from dlgo.scoring import GameResult
+
+__all__ = [
+    'PlayoutBatch',
+    'random_playouts',
+]
+
+EMPTY = 0
+BLACK = 1
+WHITE = 2
+# the extra point past the end of the board, which off-board neighbors
+# point to
+EDGE = 3
+
+_COLORS = {Player.black: BLACK, Player.white: WHITE}
+
+
+class _Geometry:
+    # Neighbor and corner tables for a board size. Points are numbered
+    # row by row; index num_points stands for anything off the board.
+    def __init__(self, num_rows, num_cols):
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.num_points = num_rows * num_cols
+        self.neighbors = np.zeros((self.num_points, 4), dtype=np.int64)
+        self.corners = np.zeros((self.num_points, 4), dtype=np.int64)
+        for row in range(1, num_rows + 1):
+            for col in range(1, num_cols + 1):
+                point = Point(row, col)
+                idx = self.index(point)
+                self.neighbors[idx] = [self.index(p) for p in point.neighbors()]
+                self.corners[idx] = [
+                    self.index(Point(row + dr, col + dc))
+                    for dr, dc in ((-1, -1), (-1, 1), (1, -1), (1, 1))
+                ]
+
+    def index(self, point):
+        if 1 <= point.row <= self.num_rows and 1 <= point.col <= self.num_cols:
+            return (point.row - 1) * self.num_cols + point.col - 1
+        return self.num_points
+
+    def point(self, idx):
+        return Point(idx // self.num_cols + 1, idx % self.num_cols + 1)
+
+
+_geometries = {}
+
+def _geometry(num_rows, num_cols):
+    key = (num_rows, num_cols)
+    if key not in _geometries:
+        _geometries[key] = _Geometry(num_rows, num_cols)
+    return _geometries[key]
+
+
+class PlayoutBatch:
+    # A batch of games continuing from the same position, kept as one
+    # array of boards so that every step of all of them is a handful of
+    # NumPy operations. Like RolloutState, only simple ko is tracked.
+    def __init__(self, game_state, num_playouts):
+        board = game_state.board
+        geo = self.geo = _geometry(board.num_rows, board.num_cols)
+        start = np.full(geo.num_points + 1, EDGE, dtype=np.int8)
+        for idx in range(geo.num_points):
+            color = board.get(geo.point(idx))
+            start[idx] = EMPTY if color is None else _COLORS[color]
+        self.boards = np.tile(start, (num_playouts, 1))
+        self.next_color = _COLORS[game_state.next_player]
+
+        rollout_state = RolloutState(game_state)
+        self.num_passes = np.full(num_playouts, rollout_state.num_passes)
+        ko_point = rollout_state.ko_point()
+        ko = -1 if ko_point is None else geo.index(ko_point)
+        self.ko_points = np.full(num_playouts, ko)
+        if game_state.is_over():
+            self.num_passes[:] = 2
+        self._rows = np.arange(num_playouts)
+        self._update_groups()
+
+    def is_over(self):
+        return self.num_passes >= 2
+
+    def _label_regions(self, include_empty=False):
+        # Label every connected set of stones of the same color, and
+        # with include_empty every empty region too, with its smallest
+        # point index.
+        geo = self.geo
+        boards = self.boards
+        n = geo.num_points
+        labels = np.tile(np.arange(n + 1), (len(boards), 1))
+        same_color = boards[:, geo.neighbors] == boards[:, :n, None]
+        if not include_empty:
+            same_color &= (boards[:, :n] != EMPTY)[:, :, None]
+        while True:
+            neighbor_labels = np.where(same_color, labels[:, geo.neighbors], n)
+            new_labels = labels.copy()
+            new_labels[:, :n] = np.minimum(labels[:, :n], neighbor_labels.min(axis=2))
+            # pointer jumping: follow the labels of the labels
+            new_labels = np.take_along_axis(new_labels, new_labels, axis=1)
+            if np.array_equal(new_labels, labels):
+                return labels
+            labels = new_labels
+
+    def _update_groups(self):
+        # Find the stone groups and count the liberties of each.
+        geo = self.geo
+        boards = self.boards
+        n = geo.num_points
+        self.labels = labels = self._label_regions()
+        neighbor_colors = boards[:, geo.neighbors]
+
+        # an empty point is a liberty of each different stone group next
+        # to it; count it once per group
+        neighbor_labels = labels[:, geo.neighbors]
+        is_stone = (neighbor_colors == BLACK) | (neighbor_colors == WHITE)
+        counted = is_stone & (boards[:, :n, None] == EMPTY)
+        for d in range(1, 4):
+            for earlier in range(d):
+                counted[:, :, d] &= neighbor_labels[:, :, d] != neighbor_labels[:, :, earlier]
+        board_offsets = (self._rows * (n + 1))[:, None, None]
+        liberties = np.bincount(
+            (neighbor_labels + board_offsets)[counted],
+            minlength=len(boards) * (n + 1)).reshape(len(boards), n + 1)
+        self.liberties = np.take_along_axis(liberties, labels, axis=1)
+
+    def legal_mask(self):
+        geo = self.geo
+        n = geo.num_points
+        color = self.next_color
+        other = BLACK + WHITE - color
+        neighbor_colors = self.boards[:, geo.neighbors]
+        neighbor_liberties = self.liberties[:, geo.neighbors]
+        has_liberty = (neighbor_colors == EMPTY).any(axis=2)
+        connects = ((neighbor_colors == color) & (neighbor_liberties > 1)).any(axis=2)
+        captures = ((neighbor_colors == other) & (neighbor_liberties == 1)).any(axis=2)
+        mask = (self.boards[:, :n] == EMPTY) & (has_liberty | connects | captures)
+        mask[self._rows, self.ko_points] &= self.ko_points < 0
+        return mask
+
+    def eye_mask(self):
+        # Vectorized is_point_an_eye for the player to move.
+        geo = self.geo
+        color = self.next_color
+        neighbor_colors = self.boards[:, geo.neighbors]
+        surrounded = ((neighbor_colors == color) | (neighbor_colors == EDGE)).all(axis=2)
+        corner_colors = self.boards[:, geo.corners]
+        friendly = (corner_colors == color).sum(axis=2)
+        off_board = (corner_colors == EDGE).sum(axis=2)
+        corners_ok = np.where(off_board > 0, off_board + friendly == 4, friendly >= 3)
+        return (self.boards[:, :geo.num_points] == EMPTY) & surrounded & corners_ok
+
+    def play(self, moves):
+        # moves holds a point index per game, or -1 to pass. Finished
+        # games are left alone.
+        geo = self.geo
+        n = geo.num_points
+        color = self.next_color
+        other = BLACK + WHITE - color
+        active = ~self.is_over()
+        playing = active & (moves >= 0)
+        passing = active & (moves < 0)
+        self.num_passes[passing] += 1
+        self.num_passes[playing] = 0
+        self.ko_points[active] = -1
+
+        rows = self._rows[playing]
+        points = moves[playing]
+        if len(rows) > 0:
+            boards = self.boards
+            neighbors = geo.neighbors[points]
+            neighbor_colors = boards[rows[:, None], neighbors]
+            neighbor_labels = self.labels[rows[:, None], neighbors]
+            captured = (neighbor_colors == other) & \
+                (self.liberties[rows[:, None], neighbors] == 1)
+            lonely = ~(neighbor_colors == color).any(axis=1)
+
+            boards[rows, points] = color
+            num_captured = np.zeros(len(rows), dtype=np.int64)
+            captured_point = np.full(len(rows), -1)
+            for d in range(4):
+                hit = captured[:, d]
+                if not hit.any():
+                    continue
+                removed = (self.labels[rows[hit]] == neighbor_labels[hit, d][:, None]) & \
+                    (boards[rows[hit]] == other)
+                # two directions can touch the same group; only count it
+                # the first time
+                num_captured[hit] += removed.sum(axis=1)
+                captured_point[hit] = neighbors[hit, d]
+                cleared = boards[rows[hit]]
+                cleared[removed] = EMPTY
+                boards[rows[hit]] = cleared
+
+            # a lone stone that took a single stone and now has only that
+            # point as liberty can be taken back at once: that's a ko
+            empty_after = (boards[rows[:, None], neighbors] == EMPTY).sum(axis=1)
+            ko = (num_captured == 1) & lonely & (empty_after == 1)
+            self.ko_points[rows[ko]] = captured_point[ko]
+
+        self.next_color = other
+        self._update_groups()
+
+    def play_random(self):
+        # Every game plays a random legal move that doesn't fill one of
+        # its own eyes, or passes if there is none.
+        candidates = self.legal_mask() & ~self.eye_mask()
+        scores = np.where(candidates, np.random.random(candidates.shape), -1)
+        moves = np.argmax(scores, axis=1)
+        moves[~candidates.any(axis=1)] = -1
+        self.play(moves)
+        return moves
+
+    def winners(self):
+        # Area scoring as in scoring.compute_game_result.
+        geo = self.geo
+        n = geo.num_points
+        boards = self.boards[:, :n]
+        labels = self._label_regions(include_empty=True)[:, :n]
+        neighbor_colors = self.boards[:, geo.neighbors]
+        board_offsets = (self._rows * (n + 1))[:, None]
+        flat_labels = (labels + board_offsets).ravel()
+        size = len(boards) * (n + 1)
+        empty = (boards == EMPTY).ravel()
+
+        def region_touches(color):
+            touches = (neighbor_colors == color).any(axis=2).ravel()
+            return np.bincount(flat_labels[empty & touches], minlength=size) > 0
+
+        touches_black = region_touches(BLACK)
+        touches_white = region_touches(WHITE)
+        black_area = touches_black & ~touches_white
+        white_area = touches_white & ~touches_black
+        black_territory = (black_area[flat_labels] & empty).reshape(boards.shape).sum(axis=1)
+        white_territory = (white_area[flat_labels] & empty).reshape(boards.shape).sum(axis=1)
+        black_score = (boards == BLACK).sum(axis=1) + black_territory
+        white_score = (boards == WHITE).sum(axis=1) + white_territory
+        return [GameResult(int(b), int(w), komi=7.5).winner
+                for b, w in zip(black_score, white_score)]
+
+
+def random_playouts(game_state, num_playouts, max_moves=None):
+    # Plays num_playouts random games from game_state at once and
+    # returns the number of wins for each player.
+    if game_state.is_over():
+        winner = game_state.winner()
+        return {winner: num_playouts, winner.other: 0}
+    batch = PlayoutBatch(game_state, num_playouts)
+    if max_moves is None:
+        # random play with the eye rule ends well before this; the cap
+        # only guards against the rare ko fight
+        max_moves = 3 * batch.geo.num_points
+    for _ in range(max_moves):
+        if batch.is_over().all():
+            break
+        batch.play_random()
+    win_counts = {Player.black: 0, Player.white: 0}
+    for winner in batch.winners():
+        win_counts[winner] += 1
+    return win_counts
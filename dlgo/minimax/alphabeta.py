@@ -1,7 +1,10 @@
+import multiprocessing
 import random
+import time
+from collections import namedtuple
 
 from dlgo.agent import Agent
-from dlgo.gotypes import Player
+from dlgo.agent.stats import SearchStats
 
 __all__ = [
     'AlphaBetaAgent',
@@ -10,68 +13,266 @@ __all__ = [
 MAX_SCORE = 999999
 MIN_SCORE = -999999
 
-def alpha_beta_result(game_state, max_depth, best_black, best_white, eval_fn):
-    if game_state.is_over():
-        if game_state.winner() == game_state.next_player:
-            return MAX_SCORE
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+class TableEntry(namedtuple('TableEntry', 'depth score bound best_move')):
+    pass
+
+class SearchTimeout(Exception):
+    pass
+
+def position_key(game_state):
+    # Positions are equal for the search if the stones, the player to move
+    # and whether a pass would end the game all agree.
+    last_move = game_state.last_move
+    return (game_state.board.zobrist_hash(),
+            game_state.next_player,
+            last_move is not None and last_move.is_pass)
+
+class AlphaBetaSearch:
+    def __init__(self, eval_fn, table=None, max_table_size=1000000):
+        self.eval_fn = eval_fn
+        self.table = {} if table is None else table
+        self.max_table_size = max_table_size
+        self.killers = {}
+        self.deadline = None
+        self.nodes_searched = 0
+        self.table_hits = 0
+
+    def ordered_moves(self, game_state, ply, best_move):
+        # The best move from the table (i.e. from the previous, shallower
+        # iteration) goes first, then the killer moves for this ply.
+        moves = game_state.legal_moves()
+        first = []
+        if best_move is not None and best_move in moves:
+            first.append(best_move)
+        for killer in self.killers.get(ply, []):
+            if killer not in first and killer in moves:
+                first.append(killer)
+        return first + [move for move in moves if move not in first]
+
+    def add_killer(self, ply, move):
+        killers = self.killers.setdefault(ply, [])
+        if move in killers:
+            return
+        killers.insert(0, move)
+        del killers[2:]
+
+    def search(self, game_state, depth, alpha, beta, ply=0):
+        self.nodes_searched += 1
+        if self.deadline is not None and time.time() > self.deadline:
+            raise SearchTimeout()
+
+        if game_state.is_over():
+            if game_state.winner() == game_state.next_player:
+                return MAX_SCORE
+            else:
+                return MIN_SCORE
+
+        if depth == 0:
+            return self.eval_fn(game_state)
+
+        key = position_key(game_state)
+        entry = self.table.get(key)
+        best_move = None
+        if entry is not None:
+            self.table_hits += 1
+            best_move = entry.best_move
+            if entry.depth >= depth:
+                if entry.bound == EXACT:
+                    return entry.score
+                elif entry.bound == LOWER_BOUND:
+                    alpha = max(alpha, entry.score)
+                else:
+                    beta = min(beta, entry.score)
+                if alpha >= beta:
+                    return entry.score
+
+        original_alpha = alpha
+        best_so_far = MIN_SCORE
+        for candidate_move in self.ordered_moves(game_state, ply, best_move):
+            next_state = game_state.apply_move(candidate_move)
+            our_result = -1 * self.search(
+                next_state, depth - 1, -beta, -alpha, ply + 1)
+            if our_result > best_so_far:
+                best_so_far = our_result
+                best_move = candidate_move
+            if best_so_far > alpha:
+                alpha = best_so_far
+            if alpha >= beta:
+                self.add_killer(ply, candidate_move)
+                break
+
+        if best_so_far <= original_alpha:
+            bound = UPPER_BOUND
+        elif best_so_far >= beta:
+            bound = LOWER_BOUND
         else:
-            return MIN_SCORE
-
-    if max_depth == 0:
-        return eval_fn(game_state)
-
-    best_so_far = MIN_SCORE
-    for candidate_move in game_state.legal_moves():
-        next_state = game_state.apply_move(candidate_move)
-        opponent_best_result = alpha_beta_result(
-            next_state, max_depth - 1,
-            best_black, best_white,
-            eval_fn)
-        our_result = -1 * opponent_best_result
-
-        if our_result > best_so_far:
-            best_so_far = our_result
-
-        if game_state.next_player == Player.white:
-            if best_so_far > best_white:
-                best_white = best_so_far
-            outcome_for_black = -1 * best_so_far
-            if outcome_for_black < best_black:
-                return best_so_far
-        elif game_state.next_player == Player.black:
-            if best_so_far > best_black:
-                best_black = best_so_far
-            outcome_for_white = -1 * best_so_far
-            if outcome_for_white < best_white:
-                return best_so_far
-
-    return best_so_far
+            bound = EXACT
+        if len(self.table) >= self.max_table_size:
+            self.table.clear()
+        self.table[key] = TableEntry(depth, best_so_far, bound, best_move)
+        return best_so_far
+
+_worker_search = None
+_worker_alpha = None
+
+def _init_search_worker(eval_fn, max_table_size, shared_alpha):
+    global _worker_search, _worker_alpha
+    _worker_search = AlphaBetaSearch(eval_fn, max_table_size=max_table_size)
+    _worker_alpha = shared_alpha
+
+def _worker_search_move(next_state, depth, deadline):
+    # Search one root move with the best bound the root has found so far.
+    # Returns the score together with the alpha it was searched with and
+    # the work done, or None if we ran out of time.
+    _worker_search.deadline = deadline
+    _worker_search.killers = {}
+    _worker_search.nodes_searched = 0
+    _worker_search.table_hits = 0
+    alpha = _worker_alpha.value
+    try:
+        score = -1 * _worker_search.search(next_state, depth, MIN_SCORE, -alpha, ply=1)
+    except SearchTimeout:
+        return None
+    with _worker_alpha.get_lock():
+        if score > _worker_alpha.value:
+            _worker_alpha.value = score
+    return score, alpha, _worker_search.nodes_searched, _worker_search.table_hits
 
 class AlphaBetaAgent(Agent):
-    def __init__(self, max_depth, eval_fn):
+    def __init__(self, max_depth, eval_fn, time_limit=None, max_table_size=1000000,
+                 num_workers=0):
         Agent.__init__(self)
         self.max_depth = max_depth
         self.eval_fn = eval_fn
+        self.time_limit = time_limit
+        self.max_table_size = max_table_size
+        self.num_workers = num_workers
+        self._search = AlphaBetaSearch(eval_fn, max_table_size=max_table_size)
+        self._pool = None
+        self._shared_alpha = None
+        self._stats = None
+        self._worker_nodes = 0
+        self._worker_table_hits = 0
 
     def select_move(self, game_state):
-        best_moves = []
-        best_score = None
-        best_black = MIN_SCORE
-        best_white = MIN_SCORE
-        for possible_move in game_state.legal_moves():
+        stats = self._stats = SearchStats()
+        search = self._search
+        search.killers = {}
+        search.nodes_searched = 0
+        search.table_hits = 0
+        search.deadline = None
+        self._worker_nodes = 0
+        self._worker_table_hits = 0
+        if self.time_limit is not None:
+            search.deadline = time.time() + self.time_limit
+
+        # Shuffle first so that ties between equally good moves are
+        # broken at random.
+        moves = game_state.legal_moves()
+        random.shuffle(moves)
+        best_move = moves[0]
+        # Iterative deepening: each iteration searches the moves in the
+        # order of the previous iteration's scores, and leaves its best
+        # lines in the transposition table for the next one.
+        completed_depth = -1
+        for depth in range(self.max_depth + 1):
+            try:
+                with stats.timer('search'):
+                    scores = self.search_root(game_state, moves, depth)
+            except SearchTimeout:
+                break
+            moves.sort(key=lambda move: scores[move], reverse=True)
+            best_move = moves[0]
+            completed_depth = depth
+            stats.extra['best_score'] = float(scores[best_move])
+
+        stats.nodes_allocated = search.nodes_searched + self._worker_nodes
+        stats.cache_hits = search.table_hits + self._worker_table_hits
+        if completed_depth >= 0:
+            # root moves are searched at depth + 1 plies
+            stats.record_depth(completed_depth + 1)
+        stats.extra['completed_depth'] = completed_depth
+        stats.extra['table_size'] = len(search.table)
+        stats.finish()
+        return best_move
+
+    def diagnostics(self):
+        if self._stats is None:
+            return {}
+        return self._stats.to_dict()
+
+    def search_root(self, game_state, moves, depth):
+        if self.num_workers > 0 and len(moves) > 1:
+            return self.search_root_parallel(game_state, moves, depth)
+        scores = {}
+        alpha = MIN_SCORE
+        for possible_move in moves:
             next_state = game_state.apply_move(possible_move)
-            opponent_best_outcome = alpha_beta_result(
-                next_state, self.max_depth,
-                best_black, best_white,
-                self.eval_fn)
-            our_best_outcome = -1 * opponent_best_outcome
-            if (not best_moves) or our_best_outcome > best_score:
-                best_moves = [possible_move]
-                best_score = our_best_outcome
-                if game_state.next_player == Player.black:
-                    best_black = best_score
-                elif game_state.next_player == Player.white:
-                    best_white = best_score
-            elif our_best_outcome == best_score:
-                best_moves.append(possible_move)
-        return random.choice(best_moves)
+            our_best_outcome = -1 * self._search.search(
+                next_state, depth, MIN_SCORE, -alpha, ply=1)
+            scores[possible_move] = our_best_outcome
+            if our_best_outcome > alpha:
+                alpha = our_best_outcome
+        return scores
+
+    def search_root_parallel(self, game_state, moves, depth):
+        # Young brothers wait: the first (and usually best) move is
+        # searched here to get a bound, then its brothers are searched in
+        # parallel. Workers share the best score found so far through
+        # shared memory and use it as their window.
+        if self._pool is None:
+            self._start_pool()
+        first_move = moves[0]
+        first_score = -1 * self._search.search(
+            game_state.apply_move(first_move), depth, MIN_SCORE, MAX_SCORE, ply=1)
+        scores = {first_move: first_score}
+        self._shared_alpha.value = first_score
+        results = [
+            (possible_move, self._pool.apply_async(
+                _worker_search_move,
+                (game_state.apply_move(possible_move).detached(),
+                 depth, self._search.deadline)))
+            for possible_move in moves[1:]
+        ]
+        exact = {first_move}
+        for possible_move, result in results:
+            outcome = result.get()
+            if outcome is None:
+                raise SearchTimeout()
+            score, alpha, nodes, table_hits = outcome
+            self._worker_nodes += nodes
+            self._worker_table_hits += table_hits
+            scores[possible_move] = score
+            if score > alpha:
+                exact.add(possible_move)
+        # A move that failed low against a bound equal to the best score
+        # may or may not tie with it. Settle that for the moves in front,
+        # so that the first best move is the one the serial search finds.
+        best_score = max(scores.values())
+        for possible_move in moves:
+            if scores[possible_move] != best_score:
+                continue
+            if possible_move in exact:
+                break
+            scores[possible_move] = -1 * self._search.search(
+                game_state.apply_move(possible_move), depth, MIN_SCORE, MAX_SCORE, ply=1)
+            if scores[possible_move] == best_score:
+                break
+        return scores
+
+    def _start_pool(self):
+        self._shared_alpha = multiprocessing.Value('d', MIN_SCORE)
+        self._pool = multiprocessing.Pool(
+            processes=self.num_workers,
+            initializer=_init_search_worker,
+            initargs=(self.eval_fn, self.max_table_size, self._shared_alpha))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
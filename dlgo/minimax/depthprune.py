@@ -1,3 +1,4 @@
+import multiprocessing
 import random
 
 from dlgo.agent import Agent
@@ -38,18 +39,38 @@ def best_result(game_state, max_depth, eval_fn):
 
     return best_so_far
 
+def _worker_best_result(args):
+    next_state, max_depth, eval_fn = args
+    return best_result(next_state, max_depth, eval_fn)
+
 class DepthPrunedAgent(Agent):
-    def __init__(self, max_depth, eval_fn):
+    def __init__(self, max_depth, eval_fn, num_workers=0):
         Agent.__init__(self)
         self.max_depth = max_depth
         self.eval_fn = eval_fn
+        self.num_workers = num_workers
+        self._pool = None
 
     def select_move(self, game_state):
+        possible_moves = game_state.legal_moves()
+        next_states = [game_state.apply_move(move) for move in possible_moves]
+        if self.num_workers > 0:
+            # Without pruning there is no bound to share, so the root
+            # moves are simply split across the pool.
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(processes=self.num_workers)
+            opponent_best_outcomes = self._pool.map(
+                _worker_best_result,
+                [(next_state.detached(), self.max_depth, self.eval_fn)
+                 for next_state in next_states])
+        else:
+            opponent_best_outcomes = [
+                best_result(next_state, self.max_depth, self.eval_fn)
+                for next_state in next_states]
+
         best_moves = []
         best_score = None
-        for possible_move in game_state.legal_moves():
-            next_state = game_state.apply_move(possible_move)
-            opponent_best_outcome = best_result(next_state, self.max_depth, self.eval_fn)
+        for possible_move, opponent_best_outcome in zip(possible_moves, opponent_best_outcomes):
             our_best_outcome = -1 * opponent_best_outcome
             if (not best_moves) or our_best_outcome > best_score:
                 best_moves = [possible_move]
@@ -57,3 +78,9 @@ class DepthPrunedAgent(Agent):
             elif our_best_outcome == best_score:
                 best_moves.append(possible_move)
         return random.choice(best_moves)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
@@ -1,4 +1,5 @@
 from dlgo.rl.ac import *
 from dlgo.rl.experience import *
 from dlgo.rl.q import *
+from dlgo.rl.resign import *
 from dlgo.rl.value import *
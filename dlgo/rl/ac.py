@@ -4,14 +4,18 @@ from tensorflow.compat.v2.keras.optimizers import SGD
 from dlgo.agent.base import Agent
 from dlgo.agent.helpers import is_point_an_eye
 from dlgo import encoders
+from dlgo.encoders.symmetry import augment_batch
 from dlgo import goboard
 from dlgo import kerasutil
 
 class ACAgent(Agent):
-    def __init__(self, model, encoder):
+    def __init__(self, model, encoder, cache=None):
         self._model = model
         self._encoder = encoder
         self._collector = None
+        # an optional PositionCache, usually shared_position_cache()
+        self._cache = cache
+        self._last_value = None
 
     def set_collector(self, collector):
         self._collector = collector
@@ -19,12 +23,10 @@ class ACAgent(Agent):
     def select_move(self, game_state):
         num_moves = self._encoder.board_width * self._encoder.board_height
 
-        board_tensor = self._encoder.encode(game_state)
-        X = np.array([board_tensor])
-
-        actions, values = self._model.predict(X)
+        board_tensor, (actions, values) = self._predict(game_state)
         move_probs = np.nan_to_num(actions[0], nan=0)
         estimated_value = values[0][0]
+        self._last_value = float(estimated_value)
 
         eps = 1e-6
         move_probs = np.clip(move_probs, eps, 1 - eps)
@@ -49,7 +51,18 @@ class ACAgent(Agent):
                 return goboard.Move.play(point)
         return goboard.Move.pass_turn()
 
-    def train(self, experience, lr=0.1, batch_size=128):
+    def _predict(self, game_state):
+        if self._cache is not None:
+            return self._cache.predict(self._model, self._encoder, game_state)
+        X = self._encoder.encode_batch([game_state])
+        return X[0], self._model.predict(X)
+
+    def diagnostics(self):
+        if self._last_value is None:
+            return {}
+        return {'value': self._last_value}
+
+    def train(self, experience, lr=0.1, batch_size=128, augment=False):
         opt = SGD(lr=lr)
         self._model.compile(optimizer=opt,
             loss=['categorical_crossentropy', 'mse'],
@@ -63,9 +76,14 @@ class ACAgent(Agent):
             policy_target[i][action] = experience.advantages[i]
             reward = experience.rewards[i]
             value_target[i] = reward
-        self._model.fit(experience.states,
+        states = experience.unpacked_states()
+        if augment:
+            states, policy_target = augment_batch(states, policy_target)
+        self._model.fit(states,
             [policy_target, value_target],
             batch_size=batch_size, epochs=1)
+        if self._cache is not None:
+            self._cache.clear_outputs()
 
     def serialize(self, h5file):
         h5file.create_group('encoder')
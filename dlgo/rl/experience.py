@@ -1,7 +1,12 @@
 import numpy as np
 
+from dlgo.encoders.base import unpack_planes
+
 class ExperienceCollector:
-    def __init__(self):
+    def __init__(self, encoder=None):
+        # With an encoder, states are kept bit-packed; see Encoder.pack.
+        self.encoder = encoder
+        self.num_planes = None if encoder is None else encoder.num_planes
         self.states = []
         self.actions = []
         self.rewards = []
@@ -16,10 +21,22 @@ class ExperienceCollector:
         self._current_episode_estimated_values = []
 
     def record_decision(self, state, action, estimated_value=0):
+        if self.encoder is not None:
+            state = self.encoder.pack(state[np.newaxis])[0]
         self._current_episode_states.append(state)
         self._current_episode_actions.append(action)
         self._current_episode_estimated_values.append(estimated_value)
 
+    def num_pending_decisions(self):
+        return len(self._current_episode_states)
+
+    def discard_last_decision(self):
+        # For a decision whose move was not played after all, e.g.
+        # because the player resigned instead.
+        self._current_episode_states.pop()
+        self._current_episode_actions.pop()
+        self._current_episode_estimated_values.pop()
+
     def complete_episode(self, reward):
         num_states = len(self._current_episode_states)
         self.states += self._current_episode_states
@@ -40,17 +57,27 @@ class ExperienceCollector:
             states=np.array(self.states),
             actions=np.array(self.actions),
             rewards=np.array(self.rewards),
-            advantages=np.array(self.advantages))
+            advantages=np.array(self.advantages),
+            num_planes=self.num_planes)
 
 class ExperienceBuffer:
-    def __init__(self, states, actions, rewards, advantages):
+    def __init__(self, states, actions, rewards, advantages, num_planes=None):
         self.states = states
         self.actions = actions
         self.rewards = rewards
         self.advantages = advantages
+        # set if the states are bit-packed
+        self.num_planes = num_planes
+
+    def unpacked_states(self, dtype=np.float32):
+        if self.num_planes is None:
+            return self.states
+        return unpack_planes(self.states, self.num_planes, dtype)
 
     def serialize(self, h5file):
         h5file.create_group('experience')
+        if self.num_planes is not None:
+            h5file['experience'].attrs['num_planes'] = self.num_planes
         h5file['experience'].create_dataset('states', data=self.states)
         h5file['experience'].create_dataset('actions', data=self.actions)
         h5file['experience'].create_dataset('rewards', data=self.rewards)
@@ -65,11 +92,13 @@ def combine_experience(collectors):
         combined_states,
         combined_actions,
         combined_rewards,
-        combined_advantages)
+        combined_advantages,
+        num_planes=collectors[0].num_planes)
 
 def load_experience(h5file):
     return ExperienceBuffer(
         states=np.array(h5file['experience']['states']),
         actions=np.array(h5file['experience']['actions']),
         rewards=np.array(h5file['experience']['rewards']),
-        advantages=np.array(h5file['experience']['advantages']))
+        advantages=np.array(h5file['experience']['advantages']),
+        num_planes=h5file['experience'].attrs.get('num_planes'))
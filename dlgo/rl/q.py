@@ -6,6 +6,7 @@ from dlgo import goboard
 from dlgo import kerasutil
 from dlgo.agent import Agent
 from dlgo.agent.helpers import is_point_an_eye
+from dlgo.encoders.symmetry import augment_batch
 
 class QAgent(Agent):
     def __init__(self, model, encoder):
@@ -27,20 +28,19 @@ class QAgent(Agent):
         return ranked_moves[::-1]
 
     def select_move(self, game_state):
-        board_tensor = self._encoder.encode(game_state)
+        X = self._encoder.encode_batch([game_state])
+        board_tensor = X[0]
 
         moves = []
-        board_tensors = []
         for move in game_state.legal_moves():
             if not move.is_play:
                 continue
             moves.append(self._encoder.encode_point(move.point))
-            board_tensors.append(board_tensor)
         if not moves:
             return goboard.Move.pass_turn()
 
         num_moves = len(moves)
-        board_tensors = np.array(board_tensors)
+        board_tensors = np.repeat(X, num_moves, axis=0)
         move_vectors = np.zeros(
             (num_moves, self._encoder.num_points()))
         for i, move in enumerate(moves):
@@ -61,7 +61,7 @@ class QAgent(Agent):
                 return goboard.Move.play(point)
         return goboard.Move.pass_turn()
 
-    def train(self, experience, lr=0.1, batch_size=128):
+    def train(self, experience, lr=0.1, batch_size=128, augment=False):
         opt = SGD(lr=lr)
         self._model.compile(loss='mse', optimizer=opt)
 
@@ -75,8 +75,12 @@ class QAgent(Agent):
             actions[i][action] = 1
             y[i] = reward
 
+        states = experience.unpacked_states()
+        if augment:
+            states, actions = augment_batch(states, actions)
+
         self._model.fit(
-            [experience.states, actions], y,
+            [states, actions], y,
             batch_size=batch_size,
             epochs=1)
 
@@ -0,0 +1,90 @@
+import random
+
+__all__ = [
+    'ResignationTracker',
+]
+
+class ResignationTracker:
+    # Decides when a self-play agent should resign, based on the value
+    # estimate its diagnostics() report under 'value'. A fraction of the
+    # games are played out to the end anyway; in those we count how often
+    # a player who would have resigned went on to win, and move the
+    # threshold to keep that false positive rate near the target.
+    def __init__(self, threshold=-0.9, playout_fraction=0.1,
+                 target_false_positive_rate=0.05, calibration_games=20,
+                 step=0.02):
+        self.threshold = threshold
+        self.playout_fraction = playout_fraction
+        self.target_false_positive_rate = target_false_positive_rate
+        self.calibration_games = calibration_games
+        self.step = step
+        self.num_games = 0
+        self.num_resigned = 0
+        self.num_playouts = 0
+        self.num_would_resign = 0
+        self.num_false_positives = 0
+        self._window_would_resign = 0
+        self._window_false_positives = 0
+        self._playing_out = False
+        self._would_resign = set()
+
+    def begin_game(self):
+        self._playing_out = random.random() < self.playout_fraction
+        self._would_resign = set()
+
+    def should_resign(self, player, value):
+        if value is None or value >= self.threshold:
+            return False
+        if self._playing_out:
+            self._would_resign.add(player)
+            return False
+        return True
+
+    def complete_game(self, winner, resigned):
+        self.num_games += 1
+        if resigned:
+            self.num_resigned += 1
+        if not self._playing_out:
+            return
+        self.num_playouts += 1
+        for player in self._would_resign:
+            self.num_would_resign += 1
+            self._window_would_resign += 1
+            if player == winner:
+                self.num_false_positives += 1
+                self._window_false_positives += 1
+        if self._window_would_resign >= self.calibration_games:
+            self._calibrate()
+
+    def false_positive_rate(self):
+        if self.num_would_resign == 0:
+            return 0.0
+        return self.num_false_positives / self.num_would_resign
+
+    def _calibrate(self):
+        rate = self._window_false_positives / self._window_would_resign
+        if rate > self.target_false_positive_rate:
+            # we gave up on games we could have won; resign later
+            self.threshold -= self.step
+        elif rate < self.target_false_positive_rate / 2:
+            self.threshold += self.step
+        self._window_would_resign = 0
+        self._window_false_positives = 0
+
+    def stats(self):
+        return {
+            'games': self.num_games,
+            'resigned': self.num_resigned,
+            'played_out': self.num_playouts,
+            'would_resign': self.num_would_resign,
+            'false_positives': self.num_false_positives,
+            'false_positive_rate': self.false_positive_rate(),
+            'threshold': self.threshold,
+        }
+
+    def log(self):
+        print('Resignation: %d/%d games resigned, %d played out, '
+              'false positives %d/%d (%.3f), threshold %.3f' % (
+                  self.num_resigned, self.num_games, self.num_playouts,
+                  self.num_false_positives, self.num_would_resign,
+                  self.false_positive_rate(), self.threshold))
@@ -8,27 +8,47 @@ from dlgo.gotypes import Player
 class GameRecord(namedtuple('GameRecord', 'moves winner')):
     pass
 
-def simulate_game(black_player, white_player):
+def simulate_game(black_player, white_player, resignation=None, collectors=None):
     moves = []
     game = goboard.GameState.new_game(19)
     agents = {
         Player.black: black_player,
         Player.white: white_player,
     }
+    if resignation is not None:
+        resignation.begin_game()
     while not game.is_over():
-        next_move = agents[game.next_player].select_move(game)
+        agent = agents[game.next_player]
+        collector = None if collectors is None else collectors[game.next_player]
+        if collector is not None:
+            num_decisions = collector.num_pending_decisions()
+        next_move = agent.select_move(game)
+        if resignation is not None and resignation.should_resign(
+                game.next_player, agent.diagnostics().get('value')):
+            next_move = goboard.Move.resign()
+            # the agent recorded the move it chose, which is never played
+            if collector is not None and \
+                    collector.num_pending_decisions() > num_decisions:
+                collector.discard_last_decision()
         moves.append(next_move)
         game = game.apply_move(next_move)
 
-    game_result = scoring.compute_game_result(game)
-    print(game_result)
+    if game.last_move.is_resign:
+        winner = game.winner()
+        print('%s resigns' % game.next_player.other.name)
+    else:
+        game_result = scoring.compute_game_result(game)
+        print(game_result)
+        winner = game_result.winner
+    if resignation is not None:
+        resignation.complete_game(winner, game.last_move.is_resign)
 
     return GameRecord(
         moves=moves,
-        winner=game_result.winner
+        winner=winner
     )
 
-def experience_simulation(num_games, agent1, agent2):
+def experience_simulation(num_games, agent1, agent2, resignation=None):
     collector1 = rl.ExperienceCollector()
     collector2 = rl.ExperienceCollector()
 
@@ -43,7 +63,9 @@ def experience_simulation(num_games, agent1, agent2):
             black_player, white_player = agent1, agent2
         else:
             white_player, black_player = agent2, agent1
-        game_record = simulate_game(black_player, white_player)
+        collectors = {color1: collector1, color1.other: collector2}
+        game_record = simulate_game(black_player, white_player, resignation,
+                                    collectors)
         if game_record.winner == color1:
             collector1.complete_episode(reward=1)
             collector2.complete_episode(reward=-1)
@@ -52,4 +74,6 @@ def experience_simulation(num_games, agent1, agent2):
             collector1.complete_episode(reward=-1)
         color1 = color1.other
 
+    if resignation is not None:
+        resignation.log()
     return rl.combine_experience([collector1, collector2])
@@ -7,6 +7,7 @@ from dlgo import goboard
 from dlgo import kerasutil
 from dlgo.agent import Agent
 from dlgo.agent.helpers import is_point_an_eye
+from dlgo.encoders.symmetry import augment_batch
 
 class ValueAgent(Agent):
     def __init__(self, model, encoder, policy='eps-greedy'):
@@ -30,18 +31,16 @@ class ValueAgent(Agent):
 
     def select_move(self, game_state):
         moves = []
-        board_tensors = []
+        next_states = []
         for move in game_state.legal_moves():
             if not move.is_play:
                 continue
-            next_state = game_state.apply_move(move)
-            board_tensor = self._encoder.encode(next_state)
             moves.append(move)
-            board_tensors.append(board_tensor)
+            next_states.append(game_state.apply_move(move))
         if not moves:
             return goboard.Move.pass_turn()
 
-        board_tensors = np.array(board_tensors)
+        board_tensors = self._encoder.encode_batch(next_states)
 
         # values of the next state from opponent's view
         opp_values = self._model.predict(board_tensors)
@@ -62,13 +61,18 @@ class ValueAgent(Agent):
                                    game_state.next_player):
                 if self._collector is not None:
                     self._collector.record_decision(
-                        state=board_tensor,
+                        state=board_tensors[move_idx],
                         action=self._encoder.encode_point(move.point),
                     )
                 self._last_move_value = float(values[move_idx])
                 return move
         return goboard.Move.pass_turn()
 
+    def predict_batch(self, game_states):
+        board_tensors = self._encoder.encode_batch(game_states)
+        values = self._model.predict(board_tensors)
+        return values.reshape(len(game_states))
+
     def rank_moves_eps_greedy(self, values):
         if np.random.random() < self._temperature:
             values = np.random.random(values.shape)
@@ -85,7 +89,7 @@ class ValueAgent(Agent):
             p=p,
             replace=False)
 
-    def train(self, experience, lr=0.1, batch_size=128):
+    def train(self, experience, lr=0.1, batch_size=128, augment=False):
         opt = SGD(lr=lr)
         self._model.compile(loss='mse', optimizer=opt)
 
@@ -95,8 +99,12 @@ class ValueAgent(Agent):
             reward = experience.rewards[i]
             y[i] = 1 if reward > 0 else 0
 
+        states = experience.unpacked_states()
+        if augment:
+            states, _ = augment_batch(states)
+
         self._model.fit(
-            experience.states, y,
+            states, y,
             batch_size=batch_size,
             epochs=1)
 
@@ -0,0 +1,35 @@
+import unittest
+
+from dlgo.goboard import Board
+from dlgo.goboard import GameState
+from dlgo.gotypes import Player, Point
+from dlgo.scoring import compute_game_result, evaluate_territory
+
+
+class ScoringTest(unittest.TestCase):
+    def setUp(self):
+        # Black walls off the two left columns, white the right one.
+        self.board = Board(5, 5)
+        for row in range(1, 6):
+            self.board.place_stone(Player.black, Point(row, 3))
+            self.board.place_stone(Player.white, Point(row, 4))
+
+    def test_evaluate_territory(self):
+        territory = evaluate_territory(self.board)
+        self.assertEqual(5, territory.num_black_stones)
+        self.assertEqual(10, territory.num_black_territory)
+        self.assertEqual(5, territory.num_white_stones)
+        self.assertEqual(5, territory.num_white_territory)
+        self.assertEqual(0, territory.num_dame)
+
+    def test_compute_game_result(self):
+        game = GameState(self.board, Player.black, None, None)
+        result = compute_game_result(game)
+        self.assertEqual(15, result.b)
+        self.assertEqual(10, result.w)
+        self.assertEqual(Player.white, result.winner)
+        self.assertEqual('W+2.5', str(result))
+
+
+if __name__ == '__main__':
+    unittest.main()
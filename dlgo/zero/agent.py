@@ -1,7 +1,11 @@
+import random
+
 import numpy as np
 from keras.optimizers import SGD
 
 from ..agent import Agent
+from ..agent.stats import SearchStats, estimate_bytes, game_state_bytes
+from ..encoders.symmetry import augment_batch
 
 class Branch:
     def __init__(self, prior):
@@ -31,6 +35,19 @@ class ZeroTreeNode:
     def has_child(self, move):
         return move in self.children
 
+    def get_child(self, move):
+        return self.children[move]
+
+    def remove_child(self, move):
+        # The branch keeps its visits and value, so the move's statistics
+        # survive; the child is rebuilt if the search comes back to it.
+        del self.children[move]
+
+    def add_noise(self, alpha=0.03, weight=0.25):
+        noise = np.random.dirichlet(alpha * np.ones(len(self.branches)))
+        for branch, n in zip(self.branches.values(), noise):
+            branch.prior = (1 - weight) * branch.prior + weight * n
+
     def record_visit(self, move, value):
         self.total_visit_count += 1
         self.branches[move].visit_count += 1
@@ -38,7 +55,7 @@ class ZeroTreeNode:
 
     def expected_value(self, move):
         branch = self.branches[move]
-        if branche.visit_count == 0:
+        if branch.visit_count == 0:
             return 0.0
         return branch.total_value / branch.visit_count
 
@@ -50,42 +67,209 @@ class ZeroTreeNode:
             return self.branches[move].visit_count
         return 0
 
+    def own_bytes(self):
+        # The memory of the node itself, without its game state and the
+        # nodes around it.
+        return estimate_bytes(
+            self, [self.state, self.parent] + list(self.children.values()))
+
+def tree_size(root):
+    size = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        size += 1
+        stack.extend(node.children.values())
+    return size
+
+def same_position(state_a, state_b):
+    if state_a is state_b:
+        return True
+    return state_a.next_player == state_b.next_player and \
+        state_a.board.zobrist_hash() == state_b.board.zobrist_hash() and \
+        state_a.previous_states == state_b.previous_states
+
 class ZeroAgent(Agent):
-    def __init__(self, model, encoder, rounds_per_move=1600, c=2.0):
+    def __init__(self, model, encoder, rounds_per_move=1600, c=2.0,
+                 reuse_tree=True, stop_check_interval=50,
+                 fast_rounds_per_move=None, full_search_fraction=1.0,
+                 max_tree_bytes=None, cache=None):
         self._model = model
         self._encoder = encoder
         self._collector = None
         self._num_rounds = rounds_per_move
+        # Playout cap randomization: only a fraction of the moves get the
+        # full search and are recorded for training, the rest are played
+        # quickly with fast_rounds_per_move rounds.
+        self._num_fast_rounds = fast_rounds_per_move
+        self._full_search_fraction = full_search_fraction
+        self._max_tree_bytes = max_tree_bytes
         self._c = c
+        self._reuse_tree = reuse_tree
+        self._stop_check_interval = stop_check_interval
+        self._root = None
+        self._stats = None
+        # an optional PositionCache, usually shared_position_cache()
+        self._cache = cache
+
+    def set_collector(self, collector):
+        self._collector = collector
 
     def select_move(self, game_state):
-        root = self.create_node(game_state)
-        for i in range(self._num_rounds):
-            node = root
-            next_move = self.select_branch(node)
-            while node.has_child(next_move):
-                node = node.get_child(next_move)
+        stats = self._stats = SearchStats()
+        root = None
+        if self._reuse_tree:
+            root = self.find_subtree(game_state)
+        if root is None:
+            root = self.create_node(game_state)
+        full_search = self._num_fast_rounds is None or \
+            random.random() < self._full_search_fraction
+        num_rounds = self._num_rounds
+        # The visit counts of a recorded search are a training target,
+        # so it runs all its rounds.
+        recorded = self._collector is not None and full_search
+        stop_check_interval = 0 if recorded else self._stop_check_interval
+        if full_search:
+            # Dirichlet noise only for the searches we train on
+            root.add_noise()
+        else:
+            num_rounds = self._num_fast_rounds
+        stats.extra['reused_visits'] = int(root.total_visit_count - 1)
+        stats.extra['full_search'] = full_search
+        stats.extra['pruned_nodes'] = 0
+        num_nodes = tree_size(root)
+        # Every node holds a game state. The tree's memory is estimated
+        # from the size of both, measured on the root.
+        node_bytes = root.own_bytes() + game_state_bytes(root.state)
+        for i in range(num_rounds):
+            with stats.timer('selection'):
+                node = root
+                depth = 0
                 next_move = self.select_branch(node)
-            new_state = node.state.apply_move(next_move)
-            child_node = self.create_node(new_state, parent=node)
-            move = next_move
-            value = -1 * child_node.value
-            while node is not None:
-                node.record_visit(move, value)
+                while node.has_child(next_move):
+                    node = node.get_child(next_move)
+                    next_move = self.select_branch(node)
+                    depth += 1
+            stats.simulations += 1
+            if next_move is None:
+                stats.record_depth(depth)
+                # the game is over at this node; back up its value again
                 move = node.last_move
+                value = -1 * node.value
                 node = node.parent
-                value = -1 * value
-        if self.collector is not None:
-            root_state_tensor = self._encoder.encode(game_state)
+            else:
+                new_state = node.state.apply_move(next_move)
+                child_node = self.create_node(new_state, move=next_move, parent=node)
+                stats.record_depth(depth + 1)
+                num_nodes += 1
+                move = next_move
+                value = -1 * child_node.value
+            with stats.timer('backup'):
+                while node is not None:
+                    node.record_visit(move, value)
+                    move = node.last_move
+                    node = node.parent
+                    value = -1 * value
+            if self._max_tree_bytes is not None and \
+                    num_nodes * node_bytes > self._max_tree_bytes:
+                # prune a bit more than needed so we don't do this every round
+                with stats.timer('pruning'):
+                    pruned_size = self.prune_tree(
+                        root, self._max_tree_bytes * 3 // (4 * node_bytes))
+                stats.extra['pruned_nodes'] += num_nodes - pruned_size
+                num_nodes = pruned_size
+            if stop_check_interval and \
+                    (i + 1) % stop_check_interval == 0 and \
+                    self.is_decided(root, num_rounds - i - 1):
+                break
+        stats.extra['unused_rounds'] = num_rounds - stats.simulations
+        stats.extra['tree_nodes'] = num_nodes
+        stats.extra['tree_bytes'] = num_nodes * node_bytes
+        if recorded:
+            if self._cache is not None:
+                root_state_tensor = self._cache.encode(self._encoder, game_state)
+            else:
+                root_state_tensor = self._encoder.encode_batch([game_state])[0]
             visit_counts = np.array([
                 root.visit_count(
                     self._encoder.decode_move_index(idx))
                 for idx in range(self._encoder.num_moves())
             ])
             self._collector.record_decision(root_state_tensor, visit_counts)
-        return max(root.moves(), key=root.visit_count)
+        self._root = root if self._reuse_tree else None
+        best_move = max(root.moves(), key=root.visit_count)
+        # expected outcome of the chosen move, from our point of view
+        stats.extra['value'] = float(root.expected_value(best_move))
+        stats.finish()
+        return best_move
+
+    def diagnostics(self):
+        if self._stats is None:
+            return {}
+        return self._stats.to_dict()
+
+    @staticmethod
+    def prune_tree(root, target_size):
+        # Drop the least visited subtrees until the tree is down to
+        # target_size nodes. Their visits stay in the branch statistics
+        # of the node above; the root's own children are kept. Returns
+        # the new tree size.
+        edges = []
+        num_nodes = 0
+        stack = [(root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            num_nodes += 1
+            for move, child in node.children.items():
+                if node is not root:
+                    edges.append((node.visit_count(move), -depth, node, move))
+                stack.append((child, depth + 1))
+        # on equal visits take the deeper subtree first, so that we never
+        # remove a subtree from a node we already dropped
+        edges.sort(key=lambda edge: edge[:2])
+        for _, _, node, move in edges:
+            if num_nodes <= target_size:
+                break
+            num_nodes -= tree_size(node.get_child(move))
+            node.remove_child(move)
+        return num_nodes
+
+    @staticmethod
+    def is_decided(root, remaining_rounds):
+        # Each round adds one visit to a single root branch, so the move
+        # is decided once no branch can catch up with the most visited
+        # one in the rounds we have left.
+        counts = sorted((root.visit_count(move) for move in root.moves()),
+                        reverse=True)
+        if len(counts) < 2:
+            return True
+        return counts[1] + remaining_rounds < counts[0]
+
+    def find_subtree(self, game_state):
+        # Walk back through the game history until we reach the position
+        # we searched last time, then follow the moves played since then
+        # down the old tree.
+        if self._root is None:
+            return None
+        moves = []
+        state = game_state
+        while state is not None and not same_position(state, self._root.state):
+            moves.append(state.last_move)
+            state = state.previous_state
+        if state is None or not moves:
+            return None
+        node = self._root
+        for move in reversed(moves):
+            if not node.has_child(move):
+                return None
+            node = node.get_child(move)
+        node.parent = None
+        node.last_move = None
+        return node
 
     def select_branch(self, node):
+        if not node.branches:
+            return None
         total_n = node.total_visit_count
 
         def score_branch(move):
@@ -97,14 +281,24 @@ class ZeroAgent(Agent):
         return max(node.moves(), key=score_branch)
 
     def create_node(self, game_state, move=None, parent=None):
-        state_tensor = self._encoder.encode(game_state)
-        model_input = np.array([state_tensor])
-        priors, values = self._model.predict(model_input)
+        stats = self._stats
+        if self._cache is not None:
+            hits = self._cache.output_hits
+            with stats.timer('inference'):
+                _, (priors, values) = self._cache.predict(
+                    self._model, self._encoder, game_state)
+            if self._cache.output_hits > hits:
+                stats.cache_hits += 1
+            else:
+                stats.record_nn_call(1)
+        else:
+            with stats.timer('encoding'):
+                model_input = self._encoder.encode_batch([game_state])
+            with stats.timer('inference'):
+                priors, values = self._model.predict(model_input)
+            stats.record_nn_call(1)
+        stats.nodes_allocated += 1
         priors = priors[0]
-        # add Dirichlet noise to the root node
-        if parent is None:
-            noise = np.random.dirichlet(0.03 * np.ones_like(priors))
-            priors = 0.75 * priors + 0.25 * noise
         value = values[0][0]
         move_priors = {
             self._encoder.decode_move_index(idx): p
@@ -115,14 +309,18 @@ class ZeroAgent(Agent):
             parent.add_child(move, new_node)
         return new_node
 
-    def train(self, experience, learning_rate, batch_size):
+    def train(self, experience, learning_rate, batch_size, augment=False):
         num_examples = experience.states.shape[0]
-        model_input = experience.states
+        model_input = experience.unpacked_states()
         visit_sums = np.sum(
             experience.visit_counts, axis=1).reshape((num_examples, 1))
 
         action_target = experience.visit_counts / visit_sums
         value_target = experience.rewards
+        if augment:
+            model_input, action_target = augment_batch(model_input, action_target)
 
         self._model.compile(SGD(lr=learning_rate), loss=['categorical_crossentropy', 'mse'])
         self._model.fit(model_input, [action_target, value_target], batch_size=batch_size)
+        if self._cache is not None:
+            self._cache.clear_outputs()
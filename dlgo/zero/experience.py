@@ -1,7 +1,12 @@
 import numpy as np
 
+from dlgo.encoders.base import unpack_planes
+
 class ZeroExperienceCollector:
-    def __init__(self):
+    def __init__(self, encoder=None):
+        # With an encoder, states are kept bit-packed; see Encoder.pack.
+        self.encoder = encoder
+        self.num_planes = None if encoder is None else encoder.num_planes
         self.states = []
         self.visit_counts = []
         self.rewards = []
@@ -13,9 +18,20 @@ class ZeroExperienceCollector:
         self._current_episode_visit_counts = []
 
     def record_decision(self, state, visit_counts):
+        if self.encoder is not None:
+            state = self.encoder.pack(state[np.newaxis])[0]
         self._current_episode_states.append(state)
         self._current_episode_visit_counts.append(visit_counts)
 
+    def num_pending_decisions(self):
+        return len(self._current_episode_states)
+
+    def discard_last_decision(self):
+        # For a decision whose move was not played after all, e.g.
+        # because the player resigned instead.
+        self._current_episode_states.pop()
+        self._current_episode_visit_counts.pop()
+
     def complete_episode(self, reward):
         num_states = len(self._current_episode_states)
         self.states += self._current_episode_states
@@ -24,3 +40,41 @@ class ZeroExperienceCollector:
 
         self._current_episode_states = []
         self._current_episode_visit_counts = []
+
+class ZeroExperienceBuffer:
+    def __init__(self, states, visit_counts, rewards, num_planes=None):
+        self.states = states
+        self.visit_counts = visit_counts
+        self.rewards = rewards
+        # set if the states are bit-packed
+        self.num_planes = num_planes
+
+    def unpacked_states(self, dtype=np.float32):
+        if self.num_planes is None:
+            return self.states
+        return unpack_planes(self.states, self.num_planes, dtype)
+
+    def serialize(self, h5file):
+        h5file.create_group('experience')
+        if self.num_planes is not None:
+            h5file['experience'].attrs['num_planes'] = self.num_planes
+        h5file['experience'].create_dataset('states', data=self.states)
+        h5file['experience'].create_dataset('visit_counts', data=self.visit_counts)
+        h5file['experience'].create_dataset('rewards', data=self.rewards)
+
+def combine_experience(collectors):
+    combined_states = np.concatenate([np.array(c.states) for c in collectors])
+    combined_visit_counts = np.concatenate([np.array(c.visit_counts) for c in collectors])
+    combined_rewards = np.concatenate([np.array(c.rewards) for c in collectors])
+    return ZeroExperienceBuffer(
+        combined_states,
+        combined_visit_counts,
+        combined_rewards,
+        num_planes=collectors[0].num_planes)
+
+def load_experience(h5file):
+    return ZeroExperienceBuffer(
+        states=np.array(h5file['experience']['states']),
+        visit_counts=np.array(h5file['experience']['visit_counts']),
+        rewards=np.array(h5file['experience']['rewards']),
+        num_planes=h5file['experience'].attrs.get('num_planes'))
@@ -7,7 +7,7 @@ from dlgo import mcts
 from dlgo.utils import print_board, print_move
 
 def generate_game(board_size, rounds, max_moves, temperature):
-    boards, moves = [], []
+    states, moves = [], []
 
     encoder = get_encoder_by_name('simple', board_size)
 
@@ -20,7 +20,7 @@ def generate_game(board_size, rounds, max_moves, temperature):
         print_board(game.board)
         move = bot.select_move(game)
         if move.is_play:
-            boards.append(encoder.encode(game))
+            states.append(game)
 
             move_one_hot = np.zeros(encoder.num_points())
             move_one_hot[encoder.encode_point(move.point)] = 1
@@ -32,7 +32,7 @@ def generate_game(board_size, rounds, max_moves, temperature):
         if num_moves > max_moves:
             break
 
-    return np.array(boards), np.array(moves)
+    return encoder.encode_batch(states), np.array(moves)
 
 def main():
     parser = argparse.ArgumentParser()
@@ -44,6 +44,8 @@ def main():
     parser.add_argument('--num-games', '-n', type=int, default=10)
     parser.add_argument('--board-out')
     parser.add_argument('--move-out')
+    parser.add_argument('--packed', action='store_true',
+                        help='Save the boards bit-packed along the plane axis.')
 
     args = parser.parse_args()
     xs = []
@@ -58,6 +60,8 @@ def main():
     x = np.concatenate(xs)
     y = np.concatenate(ys)
 
+    if args.packed:
+        x = get_encoder_by_name('simple', args.board_size).pack(x)
     np.save(args.board_out, x)
     np.save(args.move_out, y)
 
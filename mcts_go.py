@@ -9,7 +9,7 @@ BOARD_SIZE = 5
 
 def main():
     game = goboard.GameState.new_game(BOARD_SIZE)
-    bot = mcts.MCTSAgent(500, temperature=1.4)
+    bot = mcts.MCTSAgent(500, temperature=1.4, use_transpositions=True)
 
     while not game.is_over():
         print_board(game.board)
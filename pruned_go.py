@@ -1,3 +1,5 @@
+import multiprocessing
+
 from six.moves import input
 
 from dlgo import goboard_fast as goboard
@@ -25,7 +27,8 @@ def capture_diff(game_state):
 
 def main():
     game = goboard.GameState.new_game(BOARD_SIZE)
-    bot = minimax.DepthPrunedAgent(3, capture_diff)
+    bot = minimax.DepthPrunedAgent(3, capture_diff,
+                                   num_workers=multiprocessing.cpu_count())
 
     while not game.is_over():
         print_board(game.board)
@@ -37,6 +40,7 @@ def main():
             move = bot.select_move(game)
         print_move(game.next_player, move)
         game = game.apply_move(move)
+    bot.close()
 
 if __name__ == '__main__':
     main()
@@ -1,13 +1,15 @@
-from keras.layers import Conv2D, BatchNormalization, Dense, Flatten, Input
+from keras.layers import Activation, BatchNormalization, Conv2D, Dense, Flatten, Input
 from keras.models import Model
-from dlgo.goboard_fast import GameState, Player
+from dlgo.goboard_fast import GameState, Move, Player
+from dlgo import rl
 from dlgo import scoring
 from dlgo import zero
 
 def simulate_game(
         board_size,
         black_agent, black_collector,
-        white_agent, white_collector):
+        white_agent, white_collector,
+        resignation=None):
     print('Starting the game!')
     game = GameState.new_game(board_size)
     agents = {
@@ -17,13 +19,35 @@ def simulate_game(
 
     black_collector.begin_episode()
     white_collector.begin_episode()
+    if resignation is not None:
+        resignation.begin_game()
+    collectors = {
+        Player.black: black_collector,
+        Player.white: white_collector,
+    }
     while not game.is_over():
-        next_move = agents[game.next_player].select_move(game)
+        agent = agents[game.next_player]
+        collector = collectors[game.next_player]
+        num_decisions = collector.num_pending_decisions()
+        next_move = agent.select_move(game)
+        if resignation is not None and resignation.should_resign(
+                game.next_player, agent.diagnostics().get('value')):
+            next_move = Move.resign()
+            # the agent recorded the move it chose, which is never played
+            if collector.num_pending_decisions() > num_decisions:
+                collector.discard_last_decision()
         game = game.apply_move(next_move)
 
-    game_result = scoring.compute_game_result(game)
-    print(game_result)
-    if game_result.winner == Player.black:
+    if game.last_move.is_resign:
+        winner = game.winner()
+        print('%s resigns' % game.next_player.other.name)
+    else:
+        game_result = scoring.compute_game_result(game)
+        print(game_result)
+        winner = game_result.winner
+    if resignation is not None:
+        resignation.complete_game(winner, game.last_move.is_resign)
+    if winner == Player.black:
         black_collector.complete_episode(1)
         white_collector.complete_episode(-1)
     else:
@@ -56,15 +80,24 @@ def main():
     value_output = Dense(1, activation='tanh')(value_hidden)
 
     model = Model(inputs=[board_input], outputs=[policy_output, value_output])
-    black_agent = zero.ZeroAgent(model, encoder, rounds_per_move=10, c=2.0)
-    white_agent = zero.ZeroAgent(model, encoder, rounds_per_move=10, c=2.0)
+    # A quarter of the moves get a full search and become training
+    # examples; the others are played with a quick search.
+    black_agent = zero.ZeroAgent(model, encoder, rounds_per_move=40, c=2.0,
+                                 fast_rounds_per_move=8, full_search_fraction=0.25)
+    white_agent = zero.ZeroAgent(model, encoder, rounds_per_move=40, c=2.0,
+                                 fast_rounds_per_move=8, full_search_fraction=0.25)
     c1 = zero.ZeroExperienceCollector()
     c2 = zero.ZeroExperienceCollector()
     black_agent.set_collector(c1)
     white_agent.set_collector(c2)
 
+    # Resign when the search expects to lose, but play one game in ten
+    # to the end to check we don't give up on games we could win.
+    resignation = rl.ResignationTracker(threshold=-0.9, playout_fraction=0.1)
     for i in range(5):
-        simulate_game(board_size, black_agent, c1, white_agent, c2)
+        simulate_game(board_size, black_agent, c1, white_agent, c2,
+                      resignation)
+    resignation.log()
 
     exp = zero.combine_experience([c1, c2])
     black_agent.train(exp, 0.01, 2048)